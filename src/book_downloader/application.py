@@ -1,20 +1,58 @@
 """CLI application."""
 
+from asyncio import Semaphore
+from asyncio import gather
 from asyncio import run
+from concurrent.futures import Executor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from dataclasses import field
+from datetime import datetime
+from json import dumps
 from pathlib import Path
+from sys import stderr
+from time import monotonic
+from typing import TextIO
 from urllib.parse import urlparse
 
 from click import Choice
+from click import Context
+from click import File
+from click import FloatRange
+from click import Group
+from click import IntRange
+from click import UsageError
 from click import argument
-from click import command
 from click import echo
+from click import group
 from click import option
 
 from book_downloader.core.book_exporter import BookExporter
+from book_downloader.core.download_manager import CacheSettings
 from book_downloader.core.download_manager import DownloadManager
 from book_downloader.core.exceptions import DownloadException
+from book_downloader.core.exceptions import IncompleteDownloadException
 from book_downloader.core.formatters import BookFormat
-from book_downloader.core.formatters import TextFormatter
+from book_downloader.core.formatters import get_formatter
+from book_downloader.internal.asyncio import process_pool
+from book_downloader.internal.cache_index import CacheLimits
+from book_downloader.internal.cli_types import PositiveFloatType
+from book_downloader.internal.cli_types import SizeType
+from book_downloader.internal.compressors import Compression
+from book_downloader.internal.http_client import HttpClient
+from book_downloader.internal.http_client import HttpSettings
+from book_downloader.internal.http_client import RetryPolicy
+from book_downloader.internal.metadata import ChaptersDiff
+from book_downloader.internal.metadata import Integrity
+from book_downloader.internal.metrics import METRICS
+from book_downloader.internal.metrics import serve_metrics
+from book_downloader.internal.misc import directory_size
+from book_downloader.internal.misc import format_size
+from book_downloader.internal.progress import ProgressBar
+from book_downloader.internal.progress import ProgressEvents
+from book_downloader.internal.progress import ProgressMode
+from book_downloader.internal.progress import ProgressReporter
+from book_downloader.internal.throttling import ThrottleSettings
 from book_downloader.sites import Service
 from book_downloader.sites import ServiceId
 from book_downloader.sites import make_service
@@ -29,25 +67,233 @@ def get_service_id(url: str) -> ServiceId | None:
     return None
 
 
+@dataclass
+class BookSummary:
+    """Outcome of a single book processing."""
+
+    url: str
+    outputs: list[Path] = field(default_factory=list)
+    changes: ChaptersDiff | None = None
+    error: str = ""
+    failures: list[str] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    def __str__(self) -> str:
+        if self.error:
+            return "\n    ".join([f"FAILED {self.url}: {self.error}", *self.failures])
+
+        text = f"OK     {self.url} -> {', '.join(map(str, self.outputs))} ({self.elapsed:.1f}s)"
+        if self.changes is not None:
+            changes = self.changes
+            text += f" [+{len(changes.added)} -{len(changes.removed)} ~{len(changes.retitled)}]"
+        return text
+
+
 async def download_book(
-    service: Service, book_url: str, save_format: BookFormat, working_dir: Path, use_cache: bool
+    client: HttpClient,
+    service: Service,
+    book_url: str,
+    save_formats: list[BookFormat],
+    working_dir: Path,
+    use_cache: bool,
+    cache_settings: CacheSettings,
+    update: bool,
+    format_workers: int | None,
 ) -> None:
-    if save_format is not BookFormat.txt:
-        raise ValueError("unsupported format requested")
+    summary = BookSummary(book_url)
+    async with client:
+        if not await service.check_service():
+            echo(f"service ({service.host()}) is unavailable", err=True)
+            return
 
-    try:
-        download_manager = DownloadManager(working_dir)
-        downloader = service.get_downloader()
-        book = await download_manager.get_book(book_url, downloader, use_cache)
+        with process_pool(format_workers) as executor:
+            try:
+                await export_book(
+                    service, summary, save_formats, working_dir, use_cache, cache_settings, update, executor
+                )
+            except DownloadException as ex:
+                echo(f"Error: {ex}", err=True, color=True)
+                if isinstance(ex, IncompleteDownloadException):
+                    echo("\n".join(ex.failures), err=True)
+
+    if summary.changes is not None:
+        report_changes(summary.changes)
+
+
+async def download_books(
+    urls: list[str],
+    auth_token: str,
+    save_formats: list[BookFormat],
+    throttling: ThrottleSettings,
+    http_settings: HttpSettings,
+    working_dir: Path,
+    use_cache: bool,
+    cache_settings: CacheSettings,
+    update: bool,
+    format_workers: int | None,
+    max_books: int,
+    metrics_port: int | None = None,
+    progress: ProgressReporter | None = None,
+) -> list[BookSummary]:
+    """
+    Download several books at once; they share one HTTP client and the request budget of their service.
+
+    The metrics are served at `http://127.0.0.1:<metrics_port>/metrics` during the run if the port is given.
+    """
+    books_budget = Semaphore(max_books)
+
+    async with (
+        HttpClient(http_settings) as client,
+        serve_metrics(metrics_port) if metrics_port is not None else nullcontext(),
+    ):
+        services: dict[ServiceId, Service | None] = {}
+
+        def get_service(service_id: ServiceId) -> Service | None:
+            if service_id not in services:
+                services[service_id] = make_service(
+                    service_id, auth_token, client, throttling=throttling, progress=progress
+                )
+            return services[service_id]
+
+        async def download(url: str, executor: Executor | None) -> BookSummary:
+            summary = BookSummary(url)
+            async with books_budget:
+                started = monotonic()
+                try:
+                    service_id = get_service_id(url)
+                    if not service_id:
+                        raise DownloadException(reason="can't determine service")
+
+                    service = get_service(service_id)
+                    if not service:
+                        raise DownloadException(reason=f"service {service_id!r} isn't implemented yet")
+
+                    book_url = service.canonical_book_url(url)
+                    if not book_url:
+                        raise DownloadException(reason="isn't valid book url")
+                    summary.url = book_url
+
+                    if not await service.check_service():
+                        raise DownloadException(reason=f"service {service.host()!r} is unavailable")
+
+                    await export_book(
+                        service, summary, save_formats, working_dir, use_cache, cache_settings, update, executor
+                    )
+                except Exception as ex:  # one broken book must not stop the whole batch
+                    summary.error = str(ex) or type(ex).__name__
+                    if isinstance(ex, IncompleteDownloadException):
+                        summary.failures = ex.failures
+                summary.elapsed = monotonic() - started
+
+            echo(summary)
+            return summary
+
+        with process_pool(format_workers) as executor:
+            return await gather(*(download(url, executor) for url in urls))
+
+
+async def export_book(
+    service: Service,
+    summary: BookSummary,
+    save_formats: list[BookFormat],
+    working_dir: Path,
+    use_cache: bool,
+    cache_settings: CacheSettings,
+    update: bool,
+    executor: Executor | None,
+) -> None:
+    download_manager = DownloadManager(working_dir, cache_settings)
+    downloader = service.get_downloader()
+    formatters = [get_formatter(save_format) for save_format in save_formats]
+    exporter = BookExporter(working_dir=working_dir, formatters=formatters, executor=executor)
+    # the updated book must not be evicted before it's exported
+    async with download_manager.hold_book(summary.url, downloader, use_cache):
+        if update:
+            summary.changes = await download_manager.update_book(summary.url, downloader)
+
+        async with download_manager.get_book(summary.url, downloader, use_cache) as book:
+            summary.outputs = await exporter.dump(book)
+        if use_cache:
+            download_manager.record_exports(summary.url, downloader, summary.outputs)
+
+
+def read_urls(source: TextIO) -> list[str]:
+    """Read book urls (one per line; empty lines and `#` comments are skipped) without duplicates."""
+    lines = (line.strip() for line in source)
+    return list(dict.fromkeys(line for line in lines if line and not line.startswith("#")))
+
+
+def get_progress_reporter(mode: ProgressMode, batch: bool) -> ProgressReporter | None:
+    """By default, a progress bar is drawn for a single book in a terminal and a batch reports JSON events."""
+    if mode is ProgressMode.auto:
+        if batch:
+            mode = ProgressMode.json
+        else:
+            mode = ProgressMode.bar if stderr.isatty() else ProgressMode.none
+
+    if mode is ProgressMode.bar:
+        return ProgressBar()
+    if mode is ProgressMode.json:
+        return ProgressEvents()
+    return None
+
+
+def write_metrics(target: TextIO) -> None:
+    target.write(dumps(METRICS.to_json(), indent=4) + "\n")
+
+
+def days_to_seconds(days: float) -> float:
+    return days * 24 * 60 * 60
 
-        exporter = BookExporter(working_dir=working_dir, formatter=TextFormatter())
-        await exporter.dump(book)
+
+def report_changes(changes: ChaptersDiff) -> None:
+    if not changes:
+        echo("no changes in the table of contents")
+        return
+
+    for chapter in changes.added:
+        echo(f"+ {chapter.title}")
+    for chapter in changes.removed:
+        echo(f"- {chapter.title}")
+    for before, after in changes.retitled:
+        echo(f"~ {before.title} -> {after.title}")
+
+
+async def verify_book(service: Service, book_url: str, working_dir: Path) -> None:
+    try:
+        summary = await DownloadManager(working_dir).verify_book(book_url, service.get_downloader())
     except DownloadException as ex:
         echo(f"Error: {ex}", err=True, color=True)
+        return
+
+    echo(", ".join(f"{state}: {summary[state]}" for state in Integrity if summary[state]))
+
 
+class DefaultCommandGroup(Group):
+    """Run the `download` command when the command line doesn't start with a name of another command."""
 
-@command()
-@argument("url", type=str)
+    def parse_args(self, ctx: Context, args: list[str]) -> list[str]:
+        if not args or (args[0] not in self.commands and args[0] not in self.get_help_option_names(ctx)):
+            args = ["download", *args]
+        return super().parse_args(ctx, args)
+
+
+working_dir_option = option(
+    "-o",
+    "--working-dir",
+    type=Path,
+    default=Path().absolute(),
+    help="directory to download book  [default: current directory]",
+)
+
+
+@group(cls=DefaultCommandGroup)
+def cli() -> None:
+    """Small application for downloading books from litnet.com; `download` is the default command."""
+
+
+@cli.command("download")
+@argument("url", type=str, required=False)
 @option(
     "-t",
     "--auth-token",
@@ -58,32 +304,223 @@ async def download_book(
 @option(
     "-f",
     "--save-format",
+    "save_formats",
     type=Choice(BookFormat),
-    default=BookFormat.default,
+    multiple=True,
+    default=[BookFormat.default],
     show_default=True,
-    help="book save format",
-)
-@option(
-    "-o",
-    "--working-dir",
-    type=Path,
-    default=Path().absolute(),
-    help="directory to download book  [default: current directory]",
+    help="book save format; repeat the option to export the book to several formats at once",
 )
+@working_dir_option
 @option(
     "--use-cache/--no-cache",
     default=True,
     show_default=True,
     help="don't delete temporary files; it might be useful if you decide to re-download a book in other formats)",
 )
-def cli(url: str, auth_token: str, save_format: BookFormat, working_dir: Path, use_cache: bool) -> None:
-    """Small application for downloading books from litnet.com."""
+@option(
+    "--max-in-flight",
+    type=IntRange(min=1),
+    default=ThrottleSettings.max_in_flight,
+    show_default=True,
+    help="maximum number of simultaneous page requests",
+)
+@option(
+    "--initial-rate",
+    type=PositiveFloatType(),
+    default=ThrottleSettings.initial_rate,
+    show_default=True,
+    help="page requests per second to start with; adapts to server responses",
+)
+@option(
+    "--max-rate",
+    type=PositiveFloatType(),
+    default=ThrottleSettings.max_rate,
+    show_default=True,
+    help="upper bound for page requests per second",
+)
+@option(
+    "--connections-per-host",
+    type=IntRange(min=1),
+    default=HttpSettings.connections_per_host,
+    show_default=True,
+    help="size of the connection pool for a single host",
+)
+@option(
+    "--timeout",
+    type=PositiveFloatType(),
+    default=HttpSettings.timeout,
+    show_default=True,
+    help="time limit of a single request in seconds",
+)
+@option(
+    "--retries",
+    type=IntRange(min=0),
+    default=RetryPolicy.attempts - 1,
+    show_default=True,
+    help="how many times a request is repeated after a connection error, a timeout, 429 or 5xx",
+)
+@option(
+    "--format-workers",
+    type=IntRange(min=0),
+    default=None,
+    help="number of processes formatting chapters; 0 formats them in the main process  [default: number of CPUs]",
+)
+@option(
+    "--update",
+    is_flag=True,
+    help="re-read the table of contents of a cached book, download only new chapters and export it again",
+)
+@option(
+    "-i",
+    "--input-file",
+    type=File("r", encoding="utf-8"),
+    default=None,
+    help="download all book urls listed in the file ('-' for stdin) concurrently; no interactive prompts",
+)
+@option(
+    "--max-books",
+    type=IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="maximum number of books downloaded simultaneously with --input-file",
+)
+@option("--verify", is_flag=True, help="check the cached book data against its manifest; nothing is downloaded")
+@option(
+    "--cache-max-size",
+    type=SizeType(),
+    default="0",
+    help="keep the cache within the size (e.g. 500M, 2G), removing least recently used books  [default: unlimited]",
+)
+@option(
+    "--cache-max-age",
+    type=FloatRange(min=0),
+    default=0,
+    help="remove cached books unused for more days than this  [default: unlimited]",
+)
+@option(
+    "--compression",
+    type=Choice(Compression.available()),
+    default=Compression.none,
+    show_default=True,
+    help="compression of newly cached chapter texts; texts cached with other compression stay readable",
+)
+@option(
+    "--packed-cache",
+    is_flag=True,
+    help="keep the chapter texts of a newly cached book in a single file of its own instead of the shared store",
+)
+@option(
+    "--metrics-file",
+    type=File("w", encoding="utf-8"),
+    default=None,
+    help="write counters and latency histograms of the run to the file ('-' for stdout) as JSON when it's over",
+)
+@option(
+    "--metrics-port",
+    type=IntRange(min=0, max=65535),
+    default=None,
+    help="serve the metrics in the Prometheus text format at http://127.0.0.1:PORT/metrics during --input-file runs",
+)
+@option(
+    "--progress",
+    type=Choice(ProgressMode),
+    default=ProgressMode.auto,
+    show_default=True,
+    help="progress of the download on stderr: a bar with ETA or a JSON object per line; "
+    "'auto' draws the bar for a single book in a terminal and reports JSON with --input-file",
+)
+def download(
+    url: str | None,
+    auth_token: str,
+    save_formats: tuple[BookFormat, ...],
+    working_dir: Path,
+    use_cache: bool,
+    max_in_flight: int,
+    initial_rate: float,
+    max_rate: float,
+    connections_per_host: int,
+    timeout: float,
+    retries: int,
+    format_workers: int | None,
+    update: bool,
+    input_file: TextIO | None,
+    max_books: int,
+    verify: bool,
+    cache_max_size: int,
+    cache_max_age: float,
+    compression: Compression,
+    packed_cache: bool,
+    metrics_file: TextIO | None,
+    metrics_port: int | None,
+    progress: ProgressMode,
+) -> None:
+    """Download a book (or all books listed in --input-file) from litnet.com."""
+    throttling = ThrottleSettings(
+        max_in_flight=max_in_flight,
+        initial_rate=initial_rate,
+        min_rate=min(ThrottleSettings.min_rate, max_rate),
+        max_rate=max_rate,
+    )
+    http_settings = HttpSettings(
+        connections_per_host=connections_per_host,
+        timeout=timeout,
+        connect_timeout=min(HttpSettings.connect_timeout, timeout),
+        retry=RetryPolicy(attempts=retries + 1),
+    )
+    cache_settings = CacheSettings(
+        limits=CacheLimits(max_size=cache_max_size, max_age=days_to_seconds(cache_max_age)),
+        compression=compression,
+        packed=packed_cache,
+    )
+
+    if update and not use_cache:
+        echo("`--update` works with the cache only, so `--no-cache` is ignored", err=True)
+        use_cache = True
+
+    if input_file is not None:
+        if verify:
+            raise UsageError("--verify checks a single URL and can't be combined with --input-file")
+        urls = ([url] if url else []) + read_urls(input_file)
+        summaries = run(
+            download_books(
+                urls,
+                auth_token,
+                list(dict.fromkeys(save_formats)),
+                throttling,
+                http_settings,
+                working_dir,
+                use_cache,
+                cache_settings,
+                update,
+                format_workers,
+                max_books,
+                metrics_port,
+                get_progress_reporter(progress, batch=True),
+            )
+        )
+        if metrics_file is not None:
+            write_metrics(metrics_file)
+        failed = sum(1 for summary in summaries if summary.error)
+        echo(f"{len(summaries) - failed} of {len(summaries)} books downloaded")
+        if failed:
+            raise SystemExit(1)
+        return
+
+    if not url:
+        raise UsageError("either URL or --input-file is required")
+
+    if metrics_port is not None:
+        echo("`--metrics-port` works with --input-file only, so it's ignored", err=True)
+
     service_id = get_service_id(url)
     if not service_id:
         echo(f"can't determine service for url ({url})", err=True)
         return
 
-    service = make_service(service_id, auth_token)
+    client = HttpClient(http_settings)
+    reporter = get_progress_reporter(progress, batch=False)
+    service = make_service(service_id, auth_token, client, throttling=throttling, progress=reporter)
     if not service:
         echo(f"service {service_id!r} isn't implemented yet", err=True)
         return
@@ -93,18 +530,121 @@ def cli(url: str, auth_token: str, save_format: BookFormat, working_dir: Path, u
         echo(f"url ({url}) isn't valid book url", err=True)
         return
 
-    if not run(service.check_url(url)):
-        echo(f"url ({url}) is unreachable", err=True)
+    if verify:
+        run(verify_book(service, url, working_dir))
         return
 
-    if save_format is not BookFormat.default:
-        echo(f"selected format({save_format}) isn't supported yet. the `txt` format will be chosen", err=True)
-        save_format = BookFormat.default
-
-    run(download_book(service, url, save_format, working_dir, use_cache))
+    run(
+        download_book(
+            client,
+            service,
+            url,
+            list(dict.fromkeys(save_formats)),
+            working_dir,
+            use_cache,
+            cache_settings,
+            update,
+            format_workers,
+        )
+    )
+    if metrics_file is not None:
+        write_metrics(metrics_file)
 
     input("Press Enter to exit...")
 
 
+@cli.group()
+def cache() -> None:
+    """Inspect and clean up the cache of downloaded books."""
+
+
+@cache.command("list")
+@argument("search", required=False, default="")
+@working_dir_option
+@option("--incomplete", is_flag=True, help="only the books with chapters that aren't downloaded yet")
+@option("--exports", is_flag=True, help="also list the files every book was exported to")
+def cache_list(search: str, working_dir: Path, incomplete: bool, exports: bool) -> None:
+    """List the cached books (whose url, author or title contains SEARCH), the most recently used first."""
+    index = DownloadManager(working_dir).cache_index
+    entries = [entry for entry in index.entries(search) if not (incomplete and entry.complete)]
+    if not entries:
+        echo("no cached books found" if search or incomplete else "the cache is empty")
+        return
+
+    for entry in reversed(entries):
+        last_access = datetime.fromtimestamp(entry.last_access).strftime("%Y-%m-%d %H:%M")
+        chapters = f"{entry.chapters_done}/{entry.chapters}"
+        echo(
+            f"{last_access}  {format_size(entry.size):>10}  {chapters:>9}  [{entry.author}]{entry.title}  "
+            f"{entry.url or entry.key}"
+        )
+        if exports:
+            for record in index.exports(entry.key):
+                echo(f"{'':>40}{record.format:<5} {format_size(record.size):>10}  {record.path}")
+
+
+@cache.command("stats")
+@working_dir_option
+def cache_stats(working_dir: Path) -> None:
+    """Show how much space the cache takes."""
+    manager = DownloadManager(working_dir)
+    stats = manager.cache_index.stats()
+    echo(f"location: {manager.cache_location}")
+    echo(f"books: {stats.books} (packed: {stats.packed_books})")
+    echo(f"size: {format_size(stats.size)}")
+    echo(
+        f"chapter texts in the shared store: {stats.blobs} ({format_size(stats.blobs_size)}, "
+        f"shared by several books: {format_size(stats.shared_size)})"
+    )
+
+
+@cache.command("prune")
+@working_dir_option
+@option("--max-size", type=SizeType(), default="0", help="remove least recently used books until the cache fits")
+@option("--max-age", type=FloatRange(min=0), default=0, help="remove books unused for more days than this")
+@option("--all", "everything", is_flag=True, help="remove all cached books")
+def cache_prune(working_dir: Path, max_size: int, max_age: float, everything: bool) -> None:
+    """Remove cached books according to the limits and chapter texts no book refers to anymore."""
+    manager = DownloadManager(working_dir)
+    size_before = directory_size(manager.cache_location)
+
+    if everything:
+        removed = manager.cache_index.entries()
+        for entry in removed:
+            manager.cache_index.remove(entry.key)
+    else:
+        removed = manager.cache_index.evict(CacheLimits(max_size=max_size, max_age=days_to_seconds(max_age)))
+    manager.cache_index.collect_garbage()
+
+    freed = size_before - directory_size(manager.cache_location)
+    echo(f"removed {len(removed)} book(s), freed {format_size(max(freed, 0))}")
+
+
+@cache.command("rebuild")
+@working_dir_option
+def cache_rebuild(working_dir: Path) -> None:
+    """Re-read the cached books from disk into the catalog (e.g. after the cache was changed by hand)."""
+    books = DownloadManager(working_dir).cache_index.rebuild()
+    echo(f"cataloged {books} book(s)")
+
+
+@cache.command("compress")
+@working_dir_option
+@option(
+    "--compression",
+    type=Choice(Compression.available()),
+    default=Compression.zstd if Compression.zstd in Compression.available() else Compression.gzip,
+    show_default=True,
+    help="compression to convert the cached chapter texts to ('none' decompresses them)",
+)
+def cache_compress(working_dir: Path, compression: Compression) -> None:
+    """Convert the cached chapter texts to another compression."""
+    manager = DownloadManager(working_dir, CacheSettings(compression=compression))
+    size_before = directory_size(manager.cache_location)
+    converted = run(manager.recompress_cache())
+    size_after = directory_size(manager.cache_location)
+    echo(f"converted {converted} chapter text(s): {format_size(size_before)} -> {format_size(size_after)}")
+
+
 if __name__ == "__main__":
     cli()
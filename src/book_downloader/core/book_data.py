@@ -1,21 +1,50 @@
 """Contains book-related entities."""
 
+from collections.abc import AsyncIterable
+from collections.abc import AsyncIterator
+from collections.abc import Awaitable
+from collections.abc import Callable
 from dataclasses import dataclass
 from dataclasses import field
 
 
 @dataclass
 class ChapterData:
-    """Represents raw chapter's data."""
+    """Represents raw chapter's data; `paragraphs` are known if the content was parsed before."""
 
     title: str = ""
     content: str = ""
+    paragraphs: list[str] | None = None
+
+
+@dataclass
+class ChapterText:
+    """Represents chapter's text parsed out of its HTML; every formatter renders a chapter from it."""
+
+    title: str = ""
+    paragraphs: list[str] = field(default_factory=list)
+
+
+async def no_chapters() -> AsyncIterator[ChapterData]:
+    """Empty chapters stream."""
+    return
+    yield
+
+
+async def forget_parsed_chapter(index: int, paragraphs: list[str]) -> None:
+    """Parsed chapters aren't kept anywhere."""
 
 
 @dataclass
 class BookData:
-    """Represents raw book's data."""
+    """
+    Represents raw book's data; chapters are streamed in order.
+
+    `on_chapter_parsed` receives the paragraphs parsed out of the chapter with the given index by the exporter,
+    so they may be kept for the next export.
+    """
 
     author: str = ""
     title: str = ""
-    chapters: list[ChapterData] = field(default_factory=list)
+    chapters: AsyncIterable[ChapterData] = field(default_factory=no_chapters)
+    on_chapter_parsed: Callable[[int, list[str]], Awaitable[None]] = forget_parsed_chapter
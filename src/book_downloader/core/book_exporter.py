@@ -1,13 +1,35 @@
 """Describes BookExported protocol."""
 
+from asyncio import Future
+from collections import deque
+from collections.abc import Sequence
+from concurrent.futures import Executor
+from contextlib import AbstractAsyncContextManager
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Protocol
 
-from aiofiles import open
-
 from book_downloader.core.book_data import BookData
 from book_downloader.core.book_data import ChapterData
+from book_downloader.core.book_data import ChapterText
+from book_downloader.internal.asyncio import submit
+from book_downloader.internal.html_text import extract_paragraphs
+from book_downloader.internal.metrics import METRICS
 from book_downloader.internal.misc import ensure_directory_exists
+from book_downloader.internal.misc import sanitize_filename_part
+
+
+def book_filename(book: BookData, extension: str) -> str:
+    """Returns `[author]title.extension` with the characters that aren't allowed in file names replaced."""
+    author = sanitize_filename_part(book.author)
+    title = sanitize_filename_part(book.title)
+    return f"[{author}]{title}.{extension}"
+
+
+class BookWriter(Protocol):
+    async def write(self, title: str, content: str) -> None:
+        """Appends the rendered chapter to the book."""
 
 
 class BookFormatter(Protocol):
@@ -16,20 +38,90 @@ class BookFormatter(Protocol):
         """Returns filename for a corresponded book."""
 
     @staticmethod
-    def prepare(chapter: ChapterData) -> str:
+    def render(chapter: ChapterText) -> str:
         """Returns content of the chapter."""
 
+    def writer(self, path: Path, book: BookData) -> AbstractAsyncContextManager[BookWriter]:
+        """Opens the book file; chapters are written in order and the file is completed on exit."""
+
+
+@dataclass
+class RenderedChapter:
+    contents: list[str]
+    # paragraphs parsed out of the chapter's HTML, unless they were known before
+    parsed: list[str] | None = None
+
+
+def parse_chapter(chapter: ChapterData) -> ChapterText:
+    if chapter.paragraphs is not None:
+        return ChapterText(chapter.title, chapter.paragraphs)
+    return ChapterText(chapter.title, extract_paragraphs(chapter.content))
+
+
+def render_chapter(formatters: Sequence[BookFormatter], chapter: ChapterData) -> RenderedChapter:
+    """Parse the chapter once and render it with every formatter."""
+    text = parse_chapter(chapter)
+    contents = [formatter.render(text) for formatter in formatters]
+    return RenderedChapter(contents, parsed=text.paragraphs if chapter.paragraphs is None else None)
+
 
 class BookExporter:
-    def __init__(self, working_dir: Path, formatter: BookFormatter):
+    def __init__(
+        self, working_dir: Path, formatters: Sequence[BookFormatter], executor: Executor | None = None, window: int = 16
+    ) -> None:
+        """
+        Create an exporter producing a file per formatter in a single pass over the book.
+
+        Chapters are prepared in the `executor` (a process pool is the one that makes sense) if it's provided;
+        up to `window` chapters are prepared ahead of the one being written.
+        """
+        if not formatters:
+            raise ValueError("at least one formatter is required")
+
         self._working_dir = working_dir
-        self._formatter = formatter
+        self._formatters = tuple(formatters)
+        self._executor = executor
+        self._window = max(window, 1)
+
+    async def dump(self, book: BookData) -> list[Path]:
+        book_paths = [self._working_dir / formatter.filename(book) for formatter in self._formatters]
+        for book_path in book_paths:
+            ensure_directory_exists(book_path.parent)
 
-    async def dump(self, book: BookData) -> None:
-        book_path = self._working_dir / self._formatter.filename(book)
-        ensure_directory_exists(book_path.parent)
+        pending: deque[tuple[int, str, Future[RenderedChapter]]] = deque()
+        try:
+            async with AsyncExitStack() as stack:
+                stack.enter_context(METRICS.timer("export_seconds"))
+                writers = [
+                    await stack.enter_async_context(formatter.writer(book_path, book))
+                    for formatter, book_path in zip(self._formatters, book_paths, strict=True)
+                ]
+                index = 0
+                async for chapter in book.chapters:
+                    future = submit(self._executor, render_chapter, self._formatters, chapter)
+                    pending.append((index, chapter.title, future))
+                    index += 1
+                    if len(pending) >= self._window:
+                        await self._write_next(book, writers, pending)
+
+                while pending:
+                    await self._write_next(book, writers, pending)
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+
+        METRICS.count("books_exported")
+        return book_paths
+
+    @staticmethod
+    async def _write_next(
+        book: BookData, writers: list[BookWriter], pending: deque[tuple[int, str, Future[RenderedChapter]]]
+    ) -> None:
+        index, title, future = pending.popleft()
+        rendered = await future
+        for writer, content in zip(writers, rendered.contents, strict=True):
+            await writer.write(title, content)
+        METRICS.count("chapters_exported")
 
-        async with open(book_path, "w", encoding="utf-8") as file:
-            for chapter in book.chapters:
-                await file.write(self._formatter.prepare(chapter))
-                await file.flush()
+        if rendered.parsed is not None:
+            await book.on_chapter_parsed(index, rendered.parsed)
@@ -1,74 +1,333 @@
 """Literally, DownloadManager is the main class."""
 
+from asyncio import AbstractEventLoop
+from asyncio import CancelledError
+from asyncio import Lock
+from asyncio import Task
+from asyncio import create_task
+from asyncio import get_running_loop
+from collections import Counter
+from collections.abc import AsyncIterator
+from collections.abc import Iterator
+from contextlib import asynccontextmanager
+from contextlib import closing
+from contextlib import contextmanager
+from contextlib import suppress
+from dataclasses import dataclass
+from dataclasses import field
 from functools import cached_property
+from functools import partial
 from pathlib import Path
 from tempfile import gettempdir
+from typing import ClassVar
 from typing import Protocol
+from weakref import WeakKeyDictionary
 
 from book_downloader.core.book_data import BookData
 from book_downloader.core.book_data import ChapterData
+from book_downloader.core.exceptions import DownloadException
+from book_downloader.core.exceptions import IncompleteDownloadException
+from book_downloader.internal.asyncio import run_async
+from book_downloader.internal.blob_store import BlobStore
+from book_downloader.internal.blob_store import ChapterStore
+from book_downloader.internal.cache_index import CacheIndex
+from book_downloader.internal.cache_index import CacheLimits
+from book_downloader.internal.compressors import Compression
 from book_downloader.internal.metadata import BookMetadata
+from book_downloader.internal.metadata import ChaptersDiff
+from book_downloader.internal.metadata import Integrity
+from book_downloader.internal.metrics import METRICS
 from book_downloader.internal.misc import ensure_directory_exists
 from book_downloader.internal.misc import fingerprint
 from book_downloader.internal.misc import remove_directory
+from book_downloader.internal.pack_store import PackStore
 
 
 class BookDownloader(Protocol):
-    async def download(self, book_url: str, book_dir: Path) -> BookMetadata:
-        """Download the book's raw data."""
+    def book_key(self, book_url: str) -> str:
+        """Identify the book regardless of the URL variant it's reached by."""
+        ...
+
+    async def fetch_metadata(
+        self, book_url: str, book_dir: Path, store: ChapterStore, refresh: bool = False
+    ) -> BookMetadata:
+        """Obtain the book's metadata; `refresh` forces re-reading the table of contents."""
+
+    async def fetch_content(self, metadata: BookMetadata) -> None:
+        """Download the chapters that aren't cached yet; every chapter is marked ready once it's processed."""
+
+
+@dataclass(frozen=True)
+class CacheSettings:
+    limits: CacheLimits = field(default_factory=CacheLimits)
+    compression: Compression = Compression.none
+    packed: bool = False
 
 
 class DownloadManager:
-    def __init__(self, working_dir: Path) -> None:
+    # books of the cache being used by any manager of the process; eviction never touches them
+    _books_in_use: ClassVar[Counter[str]] = Counter()
+    # metadata of the books being downloaded or exported by any manager of the process (by identity); the stored
+    # texts they refer to are never removed, including those a chapter was restored to and that aren't recorded yet
+    _open_books: ClassVar[dict[int, BookMetadata]] = {}
+    # the cache maintenance runs in a thread; meanwhile no book is taken into use and no chapter is restored
+    _maintenance_locks: ClassVar[WeakKeyDictionary[AbstractEventLoop, Lock]] = WeakKeyDictionary()
+
+    def __init__(self, working_dir: Path, cache_settings: CacheSettings | None = None) -> None:
         self._working_dir = working_dir
+        self._cache_settings = cache_settings or CacheSettings()
         self._cached_book_data: set[Path] = set()
 
-    async def get_book(self, book_url: str, downloader: BookDownloader, use_cache: bool = True) -> BookData:
-        book_dir = self._get_working_directory(book_url, use_cache)
+    @asynccontextmanager
+    async def get_book(
+        self, book_url: str, downloader: BookDownloader, use_cache: bool = True
+    ) -> AsyncIterator[BookData]:
+        """
+        Provide the book whose chapters are streamed in order while the rest of them is still being downloaded.
+
+        Chapters are read from the cache one at a time, so the whole book never sits in memory. A chapter parsed
+        by the exporter once is kept in the cache parsed, so the next exports don't parse its HTML again.
+        """
+        book_dir = self._get_working_directory(book_url, downloader.book_key(book_url), use_cache)
         try:
-            metadata = await downloader.download(book_url, book_dir)
-            book = await self._make_book(metadata)
+            async with self._hold(book_dir, book_url, use_cache):
+                with closing(self._get_store(book_dir, use_cache)) as store:
+                    METRICS.count("books_opened")
+                    with METRICS.timer("book_metadata_seconds"):
+                        metadata = await downloader.fetch_metadata(book_url, book_dir, store)
+                    with self._open(metadata):
+                        download = create_task(self._download_content(downloader, metadata))
+                        try:
+                            book = BookData(
+                                author=metadata.author, title=metadata.title, chapters=self._stream_chapters(metadata)
+                            )
+                            if use_cache:
+                                book.on_chapter_parsed = partial(self._keep_text, metadata)
+                            yield book
+                            await download
+                            if use_cache:
+                                await metadata.save()  # compacts the journal of the download and the export
+                            self._check_completeness(metadata)
+                        finally:
+                            await self._cancel(download)
         finally:
             if not use_cache:
                 remove_directory(book_dir)
 
-        return book
+    async def update_book(self, book_url: str, downloader: BookDownloader) -> ChaptersDiff:
+        """Re-read the book's table of contents and download only the chapters that aren't cached yet."""
+        book_dir = self._get_working_directory(book_url, downloader.book_key(book_url), use_cache=True)
+        async with self._hold(book_dir, book_url, use_cache=True):
+            with closing(self._get_store(book_dir, use_cache=True)) as store:
+                previous = BookMetadata(book_dir, store)
+                await previous.load()
+
+                with METRICS.timer("book_metadata_seconds"):
+                    metadata = await downloader.fetch_metadata(book_url, book_dir, store, refresh=True)
+                with self._open(metadata):
+                    await self._download_content(downloader, metadata)
+                return ChaptersDiff.compare(previous.chapters, metadata.chapters)
+
+    @asynccontextmanager
+    async def hold_book(self, book_url: str, downloader: BookDownloader, use_cache: bool = True) -> AsyncIterator[None]:
+        """
+        Protect the cached book from eviction across several operations (e.g. an update and the export after it);
+        every operation holds the book by itself, but the limits are applied when each of them is over.
+        """
+        if not use_cache:
+            yield
+            return
+
+        book_dir = self._locate_cached_book(book_url, downloader.book_key(book_url))
+        async with self._hold(book_dir, book_url, use_cache):
+            yield
+
+    def record_exports(self, book_url: str, downloader: BookDownloader, paths: list[Path]) -> None:
+        """Catalog the files the cached book was exported to."""
+        book_dir = self._locate_cached_book(book_url, downloader.book_key(book_url))
+        self.cache_index.add_exports(book_dir, paths)
+
+    async def verify_book(self, book_url: str, downloader: BookDownloader) -> Counter[Integrity]:
+        """Validate the cached book against its manifest without touching the network."""
+        book_dir = self._locate_cached_book(book_url, downloader.book_key(book_url))
+        with closing(self._get_store(book_dir, use_cache=True)) as store:
+            metadata = BookMetadata(book_dir, store)
+            if not await metadata.load():
+                raise DownloadException(reason="The book isn't cached", url=book_url)
+
+            summary = Counter([await chapter.verify() for chapter in metadata.chapters])
+            await metadata.save()
+            return summary
 
     @cached_property
     def cache_location(self) -> Path:
         return self._working_dir / ".downloads-cache"
 
+    @cached_property
+    def cache_index(self) -> CacheIndex:
+        return CacheIndex(self.cache_location)
+
+    async def recompress_cache(self) -> int:
+        """Convert the stored chapter texts to the configured compression; return the number of converted ones."""
+        return await self._shared_store.recompress()
+
     def reset_cache(self) -> None:
         for book_dir in list(self._cached_book_data):
             self._remove_from_cache(book_dir)
 
-    def _get_working_directory(self, book_url: str, use_cache: bool) -> Path:
+    def _get_working_directory(self, book_url: str, book_key: str, use_cache: bool) -> Path:
         if not use_cache:
             working_dir = Path(gettempdir()).resolve()
-            return self._compose_book_path(working_dir, book_url)
+            book_path = self._compose_book_path(working_dir, book_key)
+            ensure_directory_exists(book_path)
+            return book_path
 
-        book_path = self._compose_book_path(self.cache_location, book_url)
+        book_path = self._locate_cached_book(book_url, book_key)
         self._add_to_cache(book_path)
         return book_path
 
+    def _locate_cached_book(self, book_url: str, book_key: str) -> Path:
+        book_path = self._compose_book_path(self.cache_location, book_key)
+        legacy_path = self._compose_book_path(self.cache_location, book_url)
+        if legacy_path.is_dir() and not book_path.exists():
+            # the cache used to be keyed by the exact url
+            legacy_path.rename(book_path)
+        return book_path
+
+    @property
+    def _shared_store(self) -> BlobStore:
+        return BlobStore(self.cache_location / "blobs", self._cache_settings.compression)
+
+    def _get_store(self, book_dir: Path, use_cache: bool) -> ChapterStore:
+        """
+        Cached books share one store, unless they're packed into files of their own; a book downloaded without
+        cache keeps its own (uncompressed) store. The format of a cached book is chosen once, when it's cached.
+        """
+        if not use_cache:
+            return BlobStore(book_dir / "blobs")
+
+        cached_as_files = (book_dir / "metadata.json").is_file() and not PackStore.exists(book_dir)
+        if PackStore.exists(book_dir) or (self._cache_settings.packed and not cached_as_files):
+            return PackStore(book_dir, self._cache_settings.compression)
+        return self._shared_store
+
     def _add_to_cache(self, book_dir: Path) -> None:
         ensure_directory_exists(book_dir)
         self._cached_book_data.add(book_dir)
 
     def _remove_from_cache(self, book_dir: Path) -> None:
-        remove_directory(book_dir)
+        self.cache_index.remove(book_dir.name, self._pinned_blobs())
         self._cached_book_data.discard(book_dir)
 
+    @asynccontextmanager
+    async def _hold(self, book_dir: Path, book_url: str, use_cache: bool) -> AsyncIterator[None]:
+        """
+        Protect the cached book from eviction while it's used; then record the access and apply the limits.
+        Both read the disk and the catalog (which may wait for other processes), so they're done in a thread.
+        """
+        if not use_cache:
+            yield
+            return
+
+        async with self._maintenance():
+            self._books_in_use[book_dir.name] += 1
+        try:
+            yield
+        finally:
+            self._books_in_use[book_dir.name] -= 1
+            async with self._maintenance():
+                keep, pinned = set(+self._books_in_use), self._pinned_blobs()
+                await run_async(self._maintain_cache, book_dir, book_url, keep, pinned)
+
+    def _maintain_cache(self, book_dir: Path, book_url: str, keep: set[str], pinned: set[str]) -> None:
+        if (book_dir / "metadata.json").is_file():
+            self.cache_index.touch(book_dir, book_url)
+        self.cache_index.evict(self._cache_settings.limits, keep=keep, pinned=pinned)
+
+    @classmethod
+    def _maintenance(cls) -> Lock:
+        """Return the lock of the cache maintenance of the running event loop."""
+        return cls._maintenance_locks.setdefault(get_running_loop(), Lock())
+
+    @contextmanager
+    def _open(self, metadata: BookMetadata) -> Iterator[None]:
+        """Protect the stored texts the book refers to (whatever it refers to at the moment) from removal."""
+        self._open_books[id(metadata)] = metadata
+        try:
+            yield
+        finally:
+            del self._open_books[id(metadata)]
+
+    @classmethod
+    def _pinned_blobs(cls) -> set[str]:
+        return {
+            digest
+            for metadata in cls._open_books.values()
+            for chapter in metadata.chapters
+            for digest in (chapter.content_hash, chapter.text_hash)
+            if digest
+        }
+
+    @classmethod
+    async def _download_content(cls, downloader: BookDownloader, meta: BookMetadata) -> None:
+        try:
+            cached = sum(1 for chapter in meta.chapters if chapter.downloaded)
+            async with cls._maintenance():
+                # a text found in the store is pinned once a chapter is restored to it; not while it's being evicted
+                restored = [chapter for chapter in meta.chapters if not chapter.downloaded and await chapter.restore()]
+            for chapter in restored:
+                await meta.record(chapter)
+            METRICS.count("chapter_cache_hits", cached + len(restored))
+            METRICS.count("chapter_cache_misses", len(meta.chapters) - cached - len(restored))
+
+            with METRICS.timer("book_download_seconds"):
+                await downloader.fetch_content(meta)
+        finally:
+            # nobody should wait for chapters that won't be downloaded anymore
+            for chapter in meta.chapters:
+                chapter.mark_ready()
+
+    @staticmethod
+    async def _stream_chapters(meta: BookMetadata) -> AsyncIterator[ChapterData]:
+        for info in meta.chapters:
+            if not info.downloaded:
+                await info.wait_ready()
+
+            paragraphs = await info.load_text()
+            if paragraphs is not None:
+                METRICS.count("parsed_text_hits")
+                yield ChapterData(info.title, paragraphs=paragraphs)
+            else:
+                METRICS.count("parsed_text_misses")
+                yield ChapterData(info.title, await info.load_content())
+
     @staticmethod
-    async def _make_book(meta: BookMetadata) -> BookData:
-        book = BookData(
-            author=meta.author,
-            title=meta.title,
-            chapters=[ChapterData(info.title, await info.load_content()) for info in meta.chapters],
-        )
-        return book
+    async def _keep_text(meta: BookMetadata, index: int, paragraphs: list[str]) -> None:
+        chapter = meta.chapters[index]
+        if chapter.downloaded:
+            await chapter.keep_text(paragraphs)
+            await meta.record(chapter)
+
+    @staticmethod
+    def _check_completeness(meta: BookMetadata) -> None:
+        failures = [
+            f"{chapter.title}: {chapter.failure or 'not downloaded'}"
+            for chapter in meta.chapters
+            if not chapter.downloaded
+        ]
+        if failures:
+            raise IncompleteDownloadException(failures)
+
+    @staticmethod
+    async def _cancel(task: Task[None]) -> None:
+        if task.done():
+            return
+
+        task.cancel()
+        with suppress(CancelledError):
+            await task
 
     @staticmethod
-    def _compose_book_path(parent: Path, book_url: str) -> Path:
-        book_dir_name = fingerprint(book_url)
+    def _compose_book_path(parent: Path, book_key: str) -> Path:
+        book_dir_name = fingerprint(book_key)
         return parent / book_dir_name
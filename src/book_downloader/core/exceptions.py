@@ -12,3 +12,11 @@ class DownloadException(Exception):
 
     def __str__(self) -> str:
         return f"{self.reason}"
+
+
+class IncompleteDownloadException(DownloadException):
+    """Some chapters couldn't be downloaded (the rest of the book is still available)."""
+
+    def __init__(self, failures: list[str], **kwargs: Any):
+        super().__init__(reason=f"{len(failures)} chapter(s) couldn't be downloaded", **kwargs)
+        self.failures = failures
@@ -3,6 +3,9 @@
 from enum import StrEnum
 from enum import auto
 
+from book_downloader.core.book_exporter import BookFormatter
+from book_downloader.core.formatters.epub import EpubFormatter
+from book_downloader.core.formatters.fb2 import Fb2Formatter
 from book_downloader.core.formatters.txt import TextFormatter
 
 
@@ -13,4 +16,15 @@ class BookFormat(StrEnum):
     default = txt
 
 
-__all__ = ("BookFormat", "TextFormatter")
+_FORMATTERS: dict[BookFormat, BookFormatter] = {
+    BookFormat.txt: TextFormatter(),
+    BookFormat.epub: EpubFormatter(),
+    BookFormat.fb2: Fb2Formatter(),
+}
+
+
+def get_formatter(book_format: BookFormat) -> BookFormatter:
+    return _FORMATTERS[book_format]
+
+
+__all__ = ("BookFormat", "EpubFormatter", "Fb2Formatter", "TextFormatter", "get_formatter")
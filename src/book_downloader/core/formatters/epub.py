@@ -0,0 +1,173 @@
+"""EPUB 3 formatter; chapters go into the zip container one by one, the book is never built in memory."""
+
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from datetime import UTC
+from datetime import datetime
+from html import escape
+from pathlib import Path
+from uuid import NAMESPACE_URL
+from uuid import uuid5
+from zipfile import ZIP_DEFLATED
+from zipfile import ZIP_STORED
+from zipfile import ZipFile
+
+from book_downloader.core.book_data import BookData
+from book_downloader.core.book_data import ChapterText
+from book_downloader.core.book_exporter import book_filename
+from book_downloader.internal.asyncio import run_async
+from book_downloader.internal.misc import remove_invalid_xml_chars
+
+_CONTAINER = """<?xml version="1.0" encoding="utf-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+"""
+
+_CHAPTER = """<?xml version="1.0" encoding="utf-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
+<head><title>{title}</title></head>
+<body>
+<section epub:type="chapter">
+<h2>{title}</h2>
+{paragraphs}
+</section>
+</body>
+</html>
+"""
+
+_NAV = """<?xml version="1.0" encoding="utf-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
+<head><title>{title}</title></head>
+<body>
+<nav epub:type="toc" id="toc">
+<h1>{title}</h1>
+<ol>
+{items}
+</ol>
+</nav>
+</body>
+</html>
+"""
+
+_NCX = """<?xml version="1.0" encoding="utf-8"?>
+<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">
+<head><meta name="dtb:uid" content="{identifier}"/></head>
+<docTitle><text>{title}</text></docTitle>
+<navMap>
+{points}
+</navMap>
+</ncx>
+"""
+
+_PACKAGE = """<?xml version="1.0" encoding="utf-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id">
+<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+<dc:identifier id="book-id">{identifier}</dc:identifier>
+<dc:title>{title}</dc:title>
+<dc:creator>{author}</dc:creator>
+<dc:language>und</dc:language>
+<meta property="dcterms:modified">{modified}</meta>
+</metadata>
+<manifest>
+<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>
+<item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>
+{items}
+</manifest>
+<spine toc="ncx">
+{itemrefs}
+</spine>
+</package>
+"""
+
+
+def _text(value: str) -> str:
+    """Make the text safe to be put into an XML document."""
+    return escape(remove_invalid_xml_chars(value))
+
+
+class EpubWriter:
+    """
+    Writes an EPUB container incrementally: every chapter is compressed into the archive as soon as it comes,
+    the table of contents and the package document are added when all chapters are known.
+    """
+
+    def __init__(self, path: Path, book: BookData) -> None:
+        self._book = book
+        self._chapters: list[tuple[str, str]] = []  # (file name, title)
+        self._archive = ZipFile(path, "w", compression=ZIP_DEFLATED)
+        # the mimetype must be the very first entry and must not be compressed
+        self._archive.writestr("mimetype", "application/epub+zip", compress_type=ZIP_STORED)
+        self._archive.writestr("META-INF/container.xml", _CONTAINER)
+
+    async def write(self, title: str, content: str) -> None:
+        name = f"chapter-{len(self._chapters) + 1:04}.xhtml"
+        await run_async(self._archive.writestr, f"OEBPS/{name}", content)
+        self._chapters.append((name, title or f"{len(self._chapters) + 1}"))
+
+    def finish(self) -> None:
+        """Add the documents describing the whole book."""
+        identifier = f"urn:uuid:{uuid5(NAMESPACE_URL, f'{self._book.author}/{self._book.title}')}"
+        title = _text(self._book.title)
+        chapters = [(name, name.removesuffix(".xhtml"), _text(label)) for name, label in self._chapters]
+
+        self._archive.writestr(
+            "OEBPS/nav.xhtml",
+            _NAV.format(
+                title=title, items="\n".join(f'<li><a href="{name}">{label}</a></li>' for name, _, label in chapters)
+            ),
+        )
+        self._archive.writestr(
+            "OEBPS/toc.ncx",
+            _NCX.format(
+                identifier=identifier,
+                title=title,
+                points="\n".join(
+                    f'<navPoint id="{item_id}" playOrder="{order}"><navLabel><text>{label}</text></navLabel>'
+                    f'<content src="{name}"/></navPoint>'
+                    for order, (name, item_id, label) in enumerate(chapters, start=1)
+                ),
+            ),
+        )
+        self._archive.writestr(
+            "OEBPS/content.opf",
+            _PACKAGE.format(
+                identifier=identifier,
+                title=title,
+                author=_text(self._book.author),
+                modified=datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                items="\n".join(
+                    f'<item id="{item_id}" href="{name}" media-type="application/xhtml+xml"/>'
+                    for name, item_id, _ in chapters
+                ),
+                itemrefs="\n".join(f'<itemref idref="{item_id}"/>' for _, item_id, _ in chapters),
+            ),
+        )
+
+    def close(self) -> None:
+        self._archive.close()
+
+
+class EpubFormatter:
+    @staticmethod
+    def filename(book: BookData) -> str:
+        return book_filename(book, "epub")
+
+    @staticmethod
+    def render(chapter: ChapterText) -> str:
+        paragraphs = "\n".join(f"<p>{_text(text)}</p>" for text in chapter.paragraphs)
+        return _CHAPTER.format(title=_text(chapter.title), paragraphs=paragraphs)
+
+    @staticmethod
+    @asynccontextmanager
+    async def writer(path: Path, book: BookData) -> AsyncIterator[EpubWriter]:
+        writer: EpubWriter = await run_async(EpubWriter, path, book)
+        try:
+            yield writer
+            await run_async(writer.finish)
+        finally:
+            await run_async(writer.close)
@@ -0,0 +1,101 @@
+"""FictionBook 2 formatter; the document is serialized incrementally, a section per chapter."""
+
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from datetime import date
+from pathlib import Path
+from typing import Any
+from uuid import NAMESPACE_URL
+from uuid import uuid5
+
+from aiofiles import open
+from lxml.etree import Element
+from lxml.etree import SubElement
+from lxml.etree import _Element
+from lxml.etree import fromstring
+from lxml.etree import tostring
+from lxml.etree import xmlfile
+
+from book_downloader.core.book_data import BookData
+from book_downloader.core.book_data import ChapterText
+from book_downloader.core.book_exporter import book_filename
+from book_downloader.internal.misc import remove_invalid_xml_chars
+
+_NAMESPACES = {None: "http://www.gribuser.ru/xml/fictionbook/2.0", "l": "http://www.w3.org/1999/xlink"}
+
+
+def _add_text(parent: _Element, tag: str, text: str) -> _Element:
+    element = SubElement(parent, tag)
+    element.text = remove_invalid_xml_chars(text)
+    return element
+
+
+def _add_author(parent: _Element, name: str) -> None:
+    author = SubElement(parent, "author")
+    match name.split():
+        case [first_name, *other_names] if other_names:
+            _add_text(author, "first-name", first_name)
+            _add_text(author, "last-name", " ".join(other_names))
+        case _:
+            _add_text(author, "nickname", name or "unknown")
+
+
+def _describe(book: BookData) -> _Element:
+    description = Element("description")
+
+    title_info = SubElement(description, "title-info")
+    _add_text(title_info, "genre", "prose_contemporary")
+    _add_author(title_info, book.author)
+    _add_text(title_info, "book-title", book.title)
+    _add_text(title_info, "lang", "und")
+
+    document_info = SubElement(description, "document-info")
+    _add_author(document_info, "book-downloader")
+    _add_text(document_info, "program-used", "book-downloader")
+    _add_text(document_info, "date", date.today().isoformat())
+    _add_text(document_info, "id", str(uuid5(NAMESPACE_URL, f"{book.author}/{book.title}")))
+    _add_text(document_info, "version", "1.0")
+    return description
+
+
+def _title(text: str) -> _Element:
+    title = Element("title")
+    _add_text(title, "p", text)
+    return title
+
+
+class Fb2Writer:
+    def __init__(self, xml: Any) -> None:
+        self._xml = xml
+
+    async def write(self, title: str, content: str) -> None:
+        await self._xml.write(fromstring(content))
+
+
+class Fb2Formatter:
+    @staticmethod
+    def filename(book: BookData) -> str:
+        return book_filename(book, "fb2")
+
+    @staticmethod
+    def render(chapter: ChapterText) -> str:
+        section = Element("section")
+        section.append(_title(chapter.title))
+        for text in chapter.paragraphs:
+            if text.strip():
+                _add_text(section, "p", text)
+            else:
+                SubElement(section, "empty-line")
+        return tostring(section, encoding="unicode")
+
+    @staticmethod
+    @asynccontextmanager
+    async def writer(path: Path, book: BookData) -> AsyncIterator[Fb2Writer]:
+        """Write the document skeleton around the sections; only one section is held in memory at a time."""
+        async with open(path, "wb") as file, xmlfile(file, encoding="utf-8") as xml:
+            await xml.write_declaration()
+            async with xml.element("FictionBook", nsmap=_NAMESPACES):
+                await xml.write(_describe(book))
+                async with xml.element("body"):
+                    await xml.write(_title(book.title))
+                    yield Fb2Writer(xml)
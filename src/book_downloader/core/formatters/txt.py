@@ -1,35 +1,42 @@
 """Basically, the default formatter."""
 
-from bs4 import BeautifulSoup
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from aiofiles import open
+from aiofiles.threadpool.text import AsyncTextIOWrapper
 
 from book_downloader.core.book_data import BookData
-from book_downloader.core.book_data import ChapterData
+from book_downloader.core.book_data import ChapterText
+from book_downloader.core.book_exporter import book_filename
+
+
+class TextWriter:
+    def __init__(self, file: AsyncTextIOWrapper) -> None:
+        self._file = file
+
+    async def write(self, title: str, content: str) -> None:
+        await self._file.write(content)
+        await self._file.flush()
 
 
 class TextFormatter:
     @staticmethod
     def filename(book: BookData) -> str:
-        author = TextFormatter._sanitize_filename_part(book.author)
-        title = TextFormatter._sanitize_filename_part(book.title)
-        return f"[{author}]{title}.txt"
+        return book_filename(book, "txt")
 
     @staticmethod
-    def prepare(chapter: ChapterData) -> str:
+    def render(chapter: ChapterText) -> str:
         text_blocks = [chapter.title]
 
-        soup = BeautifulSoup(chapter.content, "lxml")
-        text_blocks.extend(block.get_text() for block in soup.find_all("p"))
+        text_blocks.extend(chapter.paragraphs)
         text_blocks.append("\n\n")
 
         return "\n\n".join(text_blocks)
 
     @staticmethod
-    def _sanitize_filename_part(value: str) -> str:
-        invalid_chars = '<>:"/\\|?*'
-        sanitized = "".join("_" if (ch in invalid_chars or ord(ch) < 32) else ch for ch in value)
-        sanitized = sanitized.strip(" .")
-
-        if not sanitized:
-            return "unknown"
-
-        return sanitized
+    @asynccontextmanager
+    async def writer(path: Path, book: BookData) -> AsyncIterator[TextWriter]:
+        async with open(path, "w", encoding="utf-8") as file:
+            yield TextWriter(file)
@@ -1,6 +1,11 @@
+from asyncio import Future
 from asyncio import get_running_loop
 from collections.abc import Callable
+from collections.abc import Iterator
+from concurrent.futures import Executor
+from concurrent.futures import ProcessPoolExecutor
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from functools import partial
 from typing import Any
 
@@ -14,3 +19,28 @@ async def run_async(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
     call = partial(func, *args, **kwargs)
     result = await loop.run_in_executor(THREAD_POOL_EXECUTOR, call)
     return result
+
+
+def submit(executor: Executor | None, func: Callable[..., Any], *args: Any) -> Future[Any]:
+    """Schedule a sync `func` in the `executor`; without an executor it's called right away."""
+    loop = get_running_loop()
+    if executor is not None:
+        return loop.run_in_executor(executor, func, *args)
+
+    future: Future[Any] = loop.create_future()
+    try:
+        future.set_result(func(*args))
+    except Exception as ex:
+        future.set_exception(ex)
+    return future
+
+
+@contextmanager
+def process_pool(max_workers: int | None = None) -> Iterator[ProcessPoolExecutor | None]:
+    """Provide a process pool for CPU-bound work; `max_workers=0` means no pool (the work is done in place)."""
+    if max_workers == 0:
+        yield None
+        return
+
+    with ProcessPoolExecutor(max_workers) as executor:
+        yield executor
@@ -0,0 +1,166 @@
+"""Content-addressed storage of chapter texts shared by all cached books."""
+
+from collections.abc import Collection
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Protocol
+
+from aiofiles import open
+
+from book_downloader.internal.compressors import DECOMPRESSION_ERRORS
+from book_downloader.internal.compressors import Compression
+from book_downloader.internal.misc import fingerprint
+from book_downloader.internal.misc import write_atomically
+
+
+class ChapterStore(Protocol):
+    """Storage of chapter texts addressed by the hashes of their content."""
+
+    def contains(self, digest: str) -> bool: ...
+
+    async def put(self, key: str, content: bytes) -> str:
+        """Store the content of the chapter identified by `key` and return its hash."""
+        ...
+
+    async def get(self, digest: str) -> bytes | None: ...
+
+    async def lookup(self, key: str) -> str:
+        """Return the hash of the stored content of the chapter identified by `key` or an empty string."""
+        ...
+
+    def remove(self, digest: str) -> None: ...
+
+    def close(self) -> None:
+        """Release the resources held for reading."""
+        ...
+
+
+class BlobStore:
+    """
+    Keeps every chapter text once, under the fingerprint of its content (`objects/<ab>/<abcdef...>`).
+
+    Books refer to blobs by their hashes, so the same book reached via different URLs, or the same chapter
+    shared by several books, doesn't take the space twice. The index (`index/<chapter-key>`) remembers
+    the latest blob of every chapter, so an already stored chapter is never downloaded again.
+
+    New blobs are written with `compression` (the suffix of a blob file tells how it's compressed), while blobs
+    written with any other compression stay readable, so a store may be switched to another one at any moment.
+    """
+
+    def __init__(self, root: Path, compression: Compression = Compression.none) -> None:
+        self._root = root
+        self._compression = compression
+        # the configured compression is the most likely one, so it's checked first
+        self._codecs = sorted(Compression, key=lambda codec: codec is not compression)
+
+    def path(self, digest: str) -> Path | None:
+        """Return the location of the blob or None if it isn't stored."""
+        if not digest:
+            return None
+
+        return next((path for codec in self._codecs if (path := self._location(digest, codec)).is_file()), None)
+
+    def contains(self, digest: str) -> bool:
+        return self.path(digest) is not None
+
+    async def put(self, key: str, content: bytes) -> str:
+        """Store the content of the chapter identified by `key` and return its hash."""
+        digest = fingerprint(content)
+        if not self.contains(digest):
+            await write_atomically(self._location(digest, self._compression), self._compression.compress(content))
+        await write_atomically(self._index_path(key), digest.encode("ascii"))
+        return digest
+
+    async def get(self, digest: str) -> bytes | None:
+        """Return the content of the blob or None if it isn't stored or can't be decompressed."""
+        path = self.path(digest)
+        if path is None:
+            return None
+
+        async with open(path, "rb") as file:
+            data = await file.read()
+        try:
+            return Compression.from_suffix(path.suffix).decompress(data)
+        except DECOMPRESSION_ERRORS:
+            return None
+
+    async def lookup(self, key: str) -> str:
+        """Return the hash of the stored content of the chapter identified by `key` or an empty string."""
+        index_path = self._index_path(key)
+        if not index_path.is_file():
+            return ""
+
+        async with open(index_path, encoding="ascii") as file:
+            digest = (await file.read()).strip()
+
+        return digest if self.contains(digest) else ""
+
+    def remove(self, digest: str) -> None:
+        while path := self.path(digest):
+            path.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        pass  # nothing is held open between reads
+
+    def size(self, digest: str) -> int:
+        """Return the space taken by the blob on disk."""
+        path = self.path(digest)
+        return path.stat().st_size if path is not None else 0
+
+    def digests(self) -> Iterator[str]:
+        objects = self._root / "objects"
+        if objects.is_dir():
+            # temporary files of unfinished writes aren't blobs yet
+            paths = (path for path in objects.glob("*/*") if path.is_file() and path.suffix != ".download")
+            yield from dict.fromkeys(path.name.split(".", maxsplit=1)[0] for path in paths)
+
+    async def recompress(self) -> int:
+        """Rewrite the blobs stored with other compression using the store's one; return their number."""
+        converted = 0
+        for digest in list(self.digests()):
+            target = self._location(digest, self._compression)
+            if not target.is_file():
+                content = await self.get(digest)
+                if content is None or fingerprint(content) != digest:
+                    continue  # damaged blobs are left for verification
+
+                await write_atomically(target, self._compression.compress(content))
+                converted += 1
+
+            for codec in Compression:
+                if codec is not self._compression:
+                    self._location(digest, codec).unlink(missing_ok=True)
+        return converted
+
+    def _location(self, digest: str, compression: Compression) -> Path:
+        return self._root / "objects" / digest[:2] / f"{digest}{compression.suffix}"
+
+    def discard(self, key: str, digest: str) -> int:
+        """Remove the blob together with the index entry of the chapter `key`; return the number of freed bytes."""
+        freed = self.size(digest)
+        self.remove(digest)
+
+        index_path = self._index_path(key)
+        if index_path.is_file() and index_path.read_text(encoding="ascii").strip() == digest:
+            index_path.unlink(missing_ok=True)
+        return freed
+
+    def collect_garbage(self, referenced: Collection[str]) -> int:
+        """Remove the blobs that aren't `referenced` and the index entries left without blobs; return freed bytes."""
+        freed = 0
+        for digest in list(self.digests()):
+            if digest not in referenced:
+                freed += self.size(digest)
+                self.remove(digest)
+
+        index = self._root / "index"
+        if index.is_dir():
+            for index_path in index.iterdir():
+                if index_path.suffix != ".download" and not self.contains(
+                    index_path.read_text(encoding="ascii").strip()
+                ):
+                    index_path.unlink(missing_ok=True)
+        return freed
+
+    def _index_path(self, key: str) -> Path:
+        return self._root / "index" / fingerprint(key)
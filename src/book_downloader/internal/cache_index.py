@@ -0,0 +1,236 @@
+"""Persistent index of the cached books: what is cached, how much space it takes and when it was used last."""
+
+from collections.abc import Collection
+from dataclasses import dataclass
+from functools import cached_property
+from json import JSONDecodeError
+from json import loads
+from pathlib import Path
+from time import time
+from typing import Any
+
+from book_downloader.internal.blob_store import BlobStore
+from book_downloader.internal.catalog import BookRecord
+from book_downloader.internal.catalog import CacheEntry
+from book_downloader.internal.catalog import CacheStats
+from book_downloader.internal.catalog import Catalog
+from book_downloader.internal.catalog import ExportRecord
+from book_downloader.internal.metadata import journal_path
+from book_downloader.internal.metadata import parsed_text_key
+from book_downloader.internal.metadata import read_manifest
+from book_downloader.internal.misc import directory_size
+from book_downloader.internal.misc import remove_directory
+from book_downloader.internal.pack_store import PackStore
+
+
+@dataclass(frozen=True)
+class CacheLimits:
+    """Bounds of the cache; zero means no bound."""
+
+    max_size: int = 0
+    max_age: float = 0.0
+
+    def __post_init__(self) -> None:
+        if self.max_size < 0 or self.max_age < 0:
+            raise ValueError("cache limits can't be negative")
+
+    def __bool__(self) -> bool:
+        return bool(self.max_size or self.max_age)
+
+
+class CacheIndex:
+    """
+    Keeps the catalog of the cached books (`catalog.sqlite3` in the cache root, see `Catalog`): url, title,
+    chapters, exported files, size and the last access time of every book.
+
+    The size of a book includes the stored texts of its chapters, so a text shared by several books is counted
+    in each of them. A new catalog is filled from disk: books cached by an older version are added with the last
+    access taken from the former `index.json` or the modification time of their metadata.
+
+    Whether a stored text is still referred to is decided by the catalog, which learns about a book's chapters
+    when the book is touched. The texts the books in use refer to right now (including those restored from
+    the store a moment ago, before anything is written down) are passed by the caller as `pinned`. Before a text
+    is removed, the manifests of the books the catalog doesn't know as they are on disk (not cataloged yet or
+    changed since, e.g. being downloaded by another process) are checked too; garbage collection reads them all.
+    Packed books keep their texts in their own directories, the shared store doesn't serve them.
+    """
+
+    def __init__(self, cache_dir: Path) -> None:
+        self._cache_dir = cache_dir
+        self._store = BlobStore(cache_dir / "blobs")
+
+    @property
+    def file_path(self) -> Path:
+        return self._cache_dir / "catalog.sqlite3"
+
+    @cached_property
+    def catalog(self) -> Catalog:
+        catalog = Catalog(self.file_path)
+        if catalog.prepare():
+            self._populate(catalog)
+        return catalog
+
+    def entries(self, search: str = "") -> list[CacheEntry]:
+        """Return the cached books (those whose url, author or title contains `search`), least recently used first."""
+        return self.catalog.books(search)
+
+    def touch(self, book_dir: Path, url: str) -> CacheEntry:
+        """Record that the book was used right now and update its chapters and size."""
+        record = self._describe(CacheEntry(book_dir.name, url=url, last_access=time()), book_dir)
+        self.catalog.put(record)
+        return self.catalog.book(record.entry.key) or record.entry
+
+    def add_exports(self, book_dir: Path, paths: list[Path]) -> None:
+        self.catalog.add_exports(book_dir.name, paths)
+
+    def exports(self, key: str) -> list[ExportRecord]:
+        return self.catalog.exports(key)
+
+    def remove(self, key: str, pinned: Collection[str] = ()) -> int:
+        """
+        Remove the book and the stored texts neither other books nor `pinned` refer to; return the number of
+        freed bytes. The book's own texts are taken from its manifest, it might be newer than the catalog.
+        """
+        book_dir = self._cache_dir / key
+        stored = [] if PackStore.exists(book_dir) else _stored_data(read_manifest(book_dir))
+        digests = {digest for _, digest in stored}
+        shared = self.catalog.referenced(digests, exclude=key) | set(pinned)
+        if digests - shared:
+            shared |= digests & self._uncataloged_blobs(exclude=key)
+
+        freed = directory_size(book_dir)
+        for store_key, digest in stored:
+            if digest not in shared:
+                freed += self._store.discard(store_key, digest)
+        remove_directory(book_dir)
+
+        self.catalog.remove(key)
+        return freed
+
+    def evict(self, limits: CacheLimits, keep: Collection[str] = (), pinned: Collection[str] = ()) -> list[CacheEntry]:
+        """
+        Remove the books unused for longer than `max_age`, then the least recently used ones until the cataloged
+        books fit into `max_size`. Books listed in `keep` and the stored texts listed in `pinned` are never removed.
+        """
+        if not limits:
+            return []
+
+        now = time()
+        total = self.catalog.total_size() if limits.max_size else 0
+        evicted: list[CacheEntry] = []
+        for entry in self.entries():
+            if entry.key in keep:
+                continue
+
+            expired = limits.max_age and now - entry.last_access > limits.max_age
+            oversized = limits.max_size and total > limits.max_size
+            if expired or oversized:
+                self.remove(entry.key, pinned)
+                total = self.catalog.total_size() if limits.max_size else 0
+                evicted.append(entry)
+        return evicted
+
+    def collect_garbage(self) -> int:
+        """Remove the stored texts no cached book refers to; return the number of freed bytes."""
+        return self._store.collect_garbage(self._referenced_blobs())
+
+    def rebuild(self) -> int:
+        """Re-read every cached book from disk into the catalog; return the number of cataloged books."""
+        return self._populate(self.catalog)
+
+    def stats(self) -> CacheStats:
+        return self.catalog.stats()
+
+    def _populate(self, catalog: Catalog) -> int:
+        """Catalog the books found on disk, keeping the known urls and access times; forget the vanished ones."""
+        known = {entry.key: entry for entry in catalog.books()} | self._legacy_entries()
+        present = {path.name: path for path in self._book_dirs()}
+        for key, book_dir in present.items():
+            entry = known.get(key) or CacheEntry(key, last_access=(book_dir / "metadata.json").stat().st_mtime)
+            catalog.put(self._describe(CacheEntry(key, url=entry.url, last_access=entry.last_access), book_dir))
+
+        catalog.keep_only(set(present))
+        catalog.forget_missing_exports()
+        self._legacy_path.unlink(missing_ok=True)
+        return len(present)
+
+    @property
+    def _legacy_path(self) -> Path:
+        return self._cache_dir / "index.json"
+
+    def _legacy_entries(self) -> dict[str, CacheEntry]:
+        """Entries of `index.json` the cache was indexed by before the catalog."""
+        try:
+            json = loads(self._legacy_path.read_text(encoding="utf-8"))
+        except FileNotFoundError, JSONDecodeError:
+            return {}
+        return {
+            key: CacheEntry(key, url=value.get("url", ""), last_access=value.get("last_access", 0.0))
+            for key, value in json.items()
+            if isinstance(value, dict)
+        }
+
+    def _describe(self, entry: CacheEntry, book_dir: Path) -> BookRecord:
+        # taken before the manifest is read, so a write in between leaves the book changed in the catalog's eyes
+        stamp = _manifest_stamp(book_dir)
+        manifest = read_manifest(book_dir)
+        entry.author = manifest.get("author", "")
+        entry.title = manifest.get("title", "")
+        blob_sizes = {digest: self._store.size(digest) for digest in self._book_blobs(book_dir, manifest)}
+        dir_size = directory_size(book_dir)
+        entry.size = dir_size + sum(blob_sizes.values())
+        return BookRecord(
+            entry, manifest, dir_size=dir_size, packed=PackStore.exists(book_dir), stamp=stamp, blob_sizes=blob_sizes
+        )
+
+    def _book_dirs(self) -> list[Path]:
+        if not self._cache_dir.is_dir():
+            return []
+        return [path for path in self._cache_dir.iterdir() if (path / "metadata.json").is_file()]
+
+    def _book_blobs(self, book_dir: Path, manifest: dict[str, Any] | None = None) -> set[str]:
+        """Return the texts of the shared store the book refers to (none, if the book is packed)."""
+        if PackStore.exists(book_dir):
+            return set()
+        return {digest for _, digest in _stored_data(manifest if manifest is not None else read_manifest(book_dir))}
+
+    def _referenced_blobs(self) -> set[str]:
+        referenced: set[str] = set()
+        for book_dir in self._book_dirs():
+            referenced |= self._book_blobs(book_dir)
+        return referenced
+
+    def _uncataloged_blobs(self, exclude: str) -> set[str]:
+        """Return the texts referred to by the books (except `exclude`) the catalog doesn't know as they are on disk."""
+        stamps = self.catalog.stamps()
+        referenced: set[str] = set()
+        for book_dir in self._book_dirs():
+            if book_dir.name != exclude and stamps.get(book_dir.name) != _manifest_stamp(book_dir):
+                referenced |= self._book_blobs(book_dir)
+        return referenced
+
+
+def _manifest_stamp(book_dir: Path) -> str:
+    """Describe the state of the book's metadata and journal on disk; every write changes it."""
+    parts = []
+    for path in (book_dir / "metadata.json", journal_path(book_dir)):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            parts.append("-")
+        else:
+            # an appended journal record always changes the size, however coarse the mtimes are
+            parts.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+    return " ".join(parts)
+
+
+def _stored_data(manifest: dict[str, Any]) -> list[tuple[str, str]]:
+    """List the store keys and hashes of the chapter texts of the book and of the paragraphs parsed out of them."""
+    stored: list[tuple[str, str]] = []
+    for chapter in manifest.get("chapters", []):
+        chapter_id = chapter.get("id", "")
+        if chapter.get("content_hash"):
+            stored.append((chapter_id, chapter["content_hash"]))
+        if chapter.get("text_hash"):
+            stored.append((parsed_text_key(chapter_id), chapter["text_hash"]))
+    return stored
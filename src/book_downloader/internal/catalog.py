@@ -0,0 +1,305 @@
+"""SQLite catalog of the cached books: their chapters, exported files, sizes and access times."""
+
+from collections.abc import Iterable
+from collections.abc import Iterator
+from contextlib import closing
+from contextlib import contextmanager
+from dataclasses import dataclass
+from dataclasses import field
+from pathlib import Path
+from sqlite3 import Connection
+from sqlite3 import connect
+from time import time
+from typing import Any
+
+_SCHEMA_VERSION = 3
+
+_SCHEMA = """
+CREATE TABLE books (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL DEFAULT '',
+    author TEXT NOT NULL DEFAULT '',
+    title TEXT NOT NULL DEFAULT '',
+    size INTEGER NOT NULL DEFAULT 0,
+    dir_size INTEGER NOT NULL DEFAULT 0,
+    packed INTEGER NOT NULL DEFAULT 0,
+    stamp TEXT NOT NULL DEFAULT '',
+    last_access REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX books_by_access ON books (last_access);
+
+CREATE TABLE chapters (
+    book_key TEXT NOT NULL REFERENCES books (key) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    total_pages INTEGER NOT NULL DEFAULT 0,
+    content_hash TEXT NOT NULL DEFAULT '',
+    content_size INTEGER NOT NULL DEFAULT 0,
+    text_hash TEXT NOT NULL DEFAULT '',
+    text_size INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (book_key, position)
+);
+CREATE INDEX chapters_by_content ON chapters (content_hash);
+CREATE INDEX chapters_by_text ON chapters (text_hash);
+
+CREATE TABLE exports (
+    path TEXT PRIMARY KEY,
+    book_key TEXT NOT NULL REFERENCES books (key) ON DELETE CASCADE,
+    format TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    exported_at REAL NOT NULL
+);
+CREATE INDEX exports_by_book ON exports (book_key);
+"""
+
+# chapters whose texts are kept in the shared store; a packed book keeps them in its own directory
+_SHARED_CHAPTERS = "SELECT chapters.* FROM chapters JOIN books ON books.key = chapters.book_key WHERE NOT books.packed"
+
+_BOOK_COLUMNS = """
+    key, url, author, title, size, last_access,
+    (SELECT COUNT(*) FROM chapters WHERE book_key = key) AS chapters,
+    (SELECT COUNT(*) FROM chapters WHERE book_key = key AND content_hash != '') AS chapters_done
+"""
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    url: str = ""
+    author: str = ""
+    title: str = ""
+    size: int = 0
+    last_access: float = 0.0
+    chapters: int = 0
+    chapters_done: int = 0
+
+    @property
+    def complete(self) -> bool:
+        return self.chapters > 0 and self.chapters_done == self.chapters
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    books: int
+    packed_books: int
+    size: int
+    blobs: int
+    blobs_size: int
+    shared_size: int
+
+
+@dataclass(frozen=True)
+class ExportRecord:
+    path: Path
+    format: str
+    size: int
+    exported_at: float
+
+
+@dataclass
+class BookRecord:
+    """Everything the catalog keeps about a book; `manifest` is the book's metadata JSON (with the journal applied)."""
+
+    entry: CacheEntry
+    manifest: dict[str, Any]
+    dir_size: int = 0
+    # the book keeps its texts in its own directory (see `PackStore`) rather than in the shared store
+    packed: bool = False
+    # the state of the manifest on disk the record was taken from
+    stamp: str = ""
+    # stored sizes of the chapter texts and the parsed paragraphs by their hashes
+    blob_sizes: dict[str, int] = field(default_factory=dict)
+
+
+class Catalog:
+    """
+    SQLite database of the cached books; `prepare` has to be called before anything else.
+
+    Every operation opens its own connection and runs in a single transaction, so several managers (or
+    processes) may use the catalog at once; the database is in WAL mode, readers don't wait for writers.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+
+    def prepare(self) -> bool:
+        """Create the database if needed; return True if it's just created (a catalog of another version is dropped)."""
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(connect(self._path, timeout=30, isolation_level=None)) as connection:
+            if self._version(connection) == _SCHEMA_VERSION:
+                return False
+
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                # somebody else might have created it in the meantime
+                if self._version(connection) == _SCHEMA_VERSION:
+                    return False
+                tables = connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+                for (table,) in tables:
+                    connection.execute(f"DROP TABLE {table}")
+                for statement in _SCHEMA.split(";"):
+                    connection.execute(statement)
+                connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+            return True
+
+    def books(self, search: str = "") -> list[CacheEntry]:
+        """Return the books whose URL, author or title contains `search`, the least recently used first."""
+        pattern = f"%{search}%"
+        with self._connect() as connection:
+            rows = connection.execute(
+                f"SELECT {_BOOK_COLUMNS} FROM books "
+                "WHERE url LIKE :pattern OR author LIKE :pattern OR title LIKE :pattern "
+                "ORDER BY last_access, key",
+                {"pattern": pattern},
+            ).fetchall()
+        return [CacheEntry(*row) for row in rows]
+
+    def book(self, key: str) -> CacheEntry | None:
+        with self._connect() as connection:
+            row = connection.execute(f"SELECT {_BOOK_COLUMNS} FROM books WHERE key = ?", (key,)).fetchone()
+        return CacheEntry(*row) if row is not None else None
+
+    def put(self, record: BookRecord) -> None:
+        """Insert or replace the book with its chapters; exported files of the book are kept."""
+        entry, manifest = record.entry, record.manifest
+        chapters = [chapter for chapter in manifest.get("chapters", []) if isinstance(chapter, dict)]
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO books (key, url, author, title, size, dir_size, packed, stamp, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                "url = excluded.url, author = excluded.author, title = excluded.title, size = excluded.size, "
+                "dir_size = excluded.dir_size, packed = excluded.packed, stamp = excluded.stamp, "
+                "last_access = excluded.last_access",
+                (
+                    entry.key,
+                    entry.url,
+                    entry.author,
+                    entry.title,
+                    entry.size,
+                    record.dir_size,
+                    record.packed,
+                    record.stamp,
+                    entry.last_access,
+                ),
+            )
+            connection.execute("DELETE FROM chapters WHERE book_key = ?", (entry.key,))
+            connection.executemany(
+                "INSERT INTO chapters VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        entry.key,
+                        position,
+                        chapter.get("id", ""),
+                        chapter.get("title", ""),
+                        chapter.get("total_pages", 0),
+                        chapter.get("content_hash", ""),
+                        record.blob_sizes.get(chapter.get("content_hash", ""), 0),
+                        chapter.get("text_hash", ""),
+                        record.blob_sizes.get(chapter.get("text_hash", ""), 0),
+                    )
+                    for position, chapter in enumerate(chapters)
+                ],
+            )
+
+    def stamps(self) -> dict[str, str]:
+        """Return the states of the manifests the books were cataloged from, by the book keys."""
+        with self._connect() as connection:
+            return dict(connection.execute("SELECT key, stamp FROM books").fetchall())
+
+    def remove(self, key: str) -> None:
+        with self._connect() as connection:
+            connection.execute("DELETE FROM books WHERE key = ?", (key,))
+
+    def keep_only(self, keys: set[str]) -> None:
+        """Forget the books that aren't listed."""
+        with self._connect() as connection:
+            known = {key for (key,) in connection.execute("SELECT key FROM books")}
+            connection.executemany("DELETE FROM books WHERE key = ?", [(key,) for key in known - keys])
+
+    def total_size(self) -> int:
+        """Space taken by the cataloged books; a text shared by several books is counted once."""
+        with self._connect() as connection:
+            (size,) = connection.execute(
+                "SELECT (SELECT COALESCE(SUM(dir_size), 0) FROM books) + COALESCE(SUM(size), 0) FROM ("
+                f"SELECT MAX(content_size) AS size FROM ({_SHARED_CHAPTERS}) "
+                "WHERE content_hash != '' GROUP BY content_hash "
+                "UNION ALL "
+                f"SELECT MAX(text_size) FROM ({_SHARED_CHAPTERS}) WHERE text_hash != '' GROUP BY text_hash)"
+            ).fetchone()
+        return int(size)
+
+    def referenced(self, digests: Iterable[str], exclude: str = "") -> set[str]:
+        """Return the shared store's texts out of `digests` some chapter of the books (except `exclude`) refers to."""
+        with self._connect() as connection:
+            return {
+                digest
+                for digest in digests
+                if connection.execute(
+                    "SELECT 1 FROM chapters JOIN books ON books.key = chapters.book_key "
+                    "WHERE (content_hash = :digest OR text_hash = :digest) AND book_key != :key AND NOT books.packed",
+                    {"digest": digest, "key": exclude},
+                ).fetchone()
+            }
+
+    def stats(self) -> CacheStats:
+        """
+        Count the books and the texts of the shared store they refer to (a text shared by several books is counted
+        once); the texts of packed books are a part of their directories, they count in the size only.
+        """
+        with self._connect() as connection:
+            books, packed_books = connection.execute("SELECT COUNT(*), COALESCE(SUM(packed), 0) FROM books").fetchone()
+            blobs, blobs_size, shared_size = connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(CASE WHEN books > 1 THEN size END), 0) FROM ("
+                f"SELECT MAX(content_size) AS size, COUNT(DISTINCT book_key) AS books FROM ({_SHARED_CHAPTERS}) "
+                "WHERE content_hash != '' GROUP BY content_hash "
+                "UNION ALL "
+                f"SELECT MAX(text_size), COUNT(DISTINCT book_key) FROM ({_SHARED_CHAPTERS}) "
+                "WHERE text_hash != '' GROUP BY text_hash)"
+            ).fetchone()
+        return CacheStats(books, packed_books, self.total_size(), blobs, blobs_size, shared_size)
+
+    def add_exports(self, key: str, paths: list[Path]) -> None:
+        """Record the files the book was exported to (the book has to be cataloged)."""
+        now = time()
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO exports SELECT ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM books WHERE key = ?)",
+                [
+                    (str(path.absolute()), key, path.suffix.lstrip("."), path.stat().st_size, now, key)
+                    for path in paths
+                    if path.is_file()
+                ],
+            )
+
+    def exports(self, key: str) -> list[ExportRecord]:
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT path, format, size, exported_at FROM exports WHERE book_key = ? ORDER BY path", (key,)
+            ).fetchall()
+        return [ExportRecord(Path(path), format, size, exported_at) for path, format, size, exported_at in rows]
+
+    def forget_missing_exports(self) -> int:
+        """Drop the records of the exported files that don't exist anymore; return their number."""
+        with self._connect() as connection:
+            paths = [path for (path,) in connection.execute("SELECT path FROM exports")]
+            missing = [(path,) for path in paths if not Path(path).is_file()]
+            connection.executemany("DELETE FROM exports WHERE path = ?", missing)
+        return len(missing)
+
+    @contextmanager
+    def _connect(self) -> Iterator[Connection]:
+        with closing(connect(self._path, timeout=30)) as connection:
+            connection.execute("PRAGMA foreign_keys = ON")
+            with connection:
+                yield connection
+
+    @staticmethod
+    def _version(connection: Connection) -> int:
+        (version,) = connection.execute("PRAGMA user_version").fetchone()
+        return int(version)
@@ -0,0 +1,38 @@
+"""Parameter types of the command line options, shared by the application and the tools."""
+
+from typing import Any
+
+from click import Context
+from click import Parameter
+from click import ParamType
+
+from book_downloader.internal.misc import parse_size
+
+
+class PositiveFloatType(ParamType):
+    """Number greater than zero."""
+
+    name = "float"
+
+    def convert(self, value: Any, param: Parameter | None, ctx: Context | None) -> float:
+        try:
+            number = float(value)
+        except TypeError, ValueError:
+            self.fail(f"{value!r} isn't a valid number", param, ctx)
+        if not number > 0:
+            self.fail(f"{value!r} isn't greater than 0", param, ctx)
+        return number
+
+
+class SizeType(ParamType):
+    """Size in bytes with an optional unit: `1500`, `500M`, `2G`."""
+
+    name = "size"
+
+    def convert(self, value: Any, param: Parameter | None, ctx: Context | None) -> int:
+        if isinstance(value, int):
+            return value
+        try:
+            return parse_size(str(value))
+        except ValueError:
+            self.fail(f"{value!r} isn't a valid size (e.g. 500M, 2G)", param, ctx)
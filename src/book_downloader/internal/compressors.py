@@ -0,0 +1,49 @@
+"""Optional compression of the cached data (gzip and, when the interpreter supports it, zstd)."""
+
+from enum import StrEnum
+from enum import auto
+from gzip import compress as gzip_compress
+from zlib import MAX_WBITS
+from zlib import decompress as zlib_decompress
+from zlib import error as ZlibError
+
+try:
+    from compression import zstd
+
+    ZSTD_AVAILABLE = True
+except ImportError:  # the interpreter is built without zstd support
+    ZSTD_AVAILABLE = False
+
+DECOMPRESSION_ERRORS: tuple[type[Exception], ...] = (ZlibError, zstd.ZstdError) if ZSTD_AVAILABLE else (ZlibError,)
+
+
+class Compression(StrEnum):
+    none = auto()
+    gzip = auto()
+    zstd = auto()
+
+    @classmethod
+    def available(cls) -> list[Compression]:
+        return [codec for codec in cls if codec is not cls.zstd or ZSTD_AVAILABLE]
+
+    @classmethod
+    def from_suffix(cls, suffix: str) -> Compression:
+        return next((codec for codec in cls if codec is not cls.none and codec.suffix == suffix), cls.none)
+
+    @property
+    def suffix(self) -> str:
+        return {Compression.none: "", Compression.gzip: ".gz", Compression.zstd: ".zst"}[self]
+
+    def compress(self, data: bytes) -> bytes:
+        if self is Compression.gzip:
+            return gzip_compress(data, mtime=0)
+        if self is Compression.zstd:
+            return zstd.compress(data)
+        return data
+
+    def decompress(self, data: bytes) -> bytes:
+        if self is Compression.gzip:
+            return zlib_decompress(data, wbits=MAX_WBITS | 16)
+        if self is Compression.zstd:
+            return zstd.decompress(data)
+        return data
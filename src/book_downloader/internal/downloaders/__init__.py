@@ -1,5 +1,6 @@
 """Provide very specific downloaders."""
 
+from book_downloader.internal.downloaders.litnet_book_downloader import LITNET_URL
 from book_downloader.internal.downloaders.litnet_book_downloader import LitnetBookDownloader
 
-__all__ = ("LitnetBookDownloader",)
+__all__ = ("LITNET_URL", "LitnetBookDownloader")
@@ -1,43 +1,73 @@
 """Performs async downloading of book metadata."""
 
 from asyncio import gather as wait_for_all
-from asyncio import sleep as sleep_for
 from json import JSONDecodeError
 from pathlib import Path
-from random import randint
+from re import search
 from typing import Any
 from typing import cast
+from urllib.parse import urlparse
 
-from aiofiles import open as open_file
+from aiohttp import ClientError
 from aiohttp import ClientResponseError
-from aiohttp import ClientSession
+from aiohttp import ContentTypeError
 from bs4 import BeautifulSoup
 from bs4.element import Tag
 
 from book_downloader.core.exceptions import DownloadException
+from book_downloader.internal.blob_store import ChapterStore
+from book_downloader.internal.http_client import HttpClient
 from book_downloader.internal.metadata import BookMetadata
 from book_downloader.internal.metadata import ChapterMetadata
-from book_downloader.internal.misc import fingerprint
+from book_downloader.internal.metrics import METRICS
+from book_downloader.internal.progress import BookProgress
+from book_downloader.internal.progress import NoProgress
+from book_downloader.internal.progress import ProgressReporter
+from book_downloader.internal.throttling import RequestScheduler
+
+LITNET_URL = "https://litnet.com"
 
 
 class LitnetBookDownloader:
-    def __init__(self, token: str):
+    def __init__(
+        self,
+        token: str,
+        client: HttpClient,
+        scheduler: RequestScheduler | None = None,
+        base_url: str = LITNET_URL,
+        progress: ProgressReporter | None = None,
+    ) -> None:
         self._token = token
+        self._base_url = base_url.rstrip("/")
         self._cookies = {"litera-frontend": token}
+        self._client = client
+        self._scheduler = scheduler or RequestScheduler()
+        self._progress = progress or NoProgress()
 
-    async def download(self, book_url: str, book_dir: Path) -> BookMetadata:
-        return await self._download_book(book_url, book_dir)
-
-    async def _download_book(self, book_url: str, book_dir: Path) -> BookMetadata:
-        metadata = await self._get_book_metadata(book_url, book_dir)
+    @classmethod
+    def book_key(cls, book_url: str) -> str:
+        """The same book is available under every interface language prefix (`/en/reader/...`, `/uk/reader/...`)."""
+        if match := search(r"\/[a-z]{2}\/reader\/([\w-]+)", urlparse(book_url).path):
+            return f"litnet.com/{match[1]}"
+        return book_url
+
+    async def fetch_metadata(
+        self, book_url: str, book_dir: Path, store: ChapterStore, refresh: bool = False
+    ) -> BookMetadata:
+        return await self._get_book_metadata(book_url, book_dir, store, refresh)
+
+    async def fetch_content(self, metadata: BookMetadata) -> None:
         await self._download_book_content(metadata)
-        return metadata
 
-    async def _get_book_metadata(self, url: str, working_dir: Path) -> BookMetadata:
-        metadata = BookMetadata(working_dir)
-        if await metadata.load() and metadata.completed:
+    async def _get_book_metadata(
+        self, url: str, working_dir: Path, store: ChapterStore, refresh: bool = False
+    ) -> BookMetadata:
+        metadata = BookMetadata(working_dir, store)
+        if await metadata.load() and metadata.completed and not refresh:
             return metadata
 
+        cached_chapters = list(metadata.chapters)
+
         response = await self._get_book_index_page(url)
         soup = BeautifulSoup(response, "lxml")
         try:
@@ -61,16 +91,18 @@ class LitnetBookDownloader:
             metadata.title = title_node.get_text()
 
             # get chapters info
-            metadata.chapters = await self._load_chapters_metadata(soup, working_dir)
+            chapters = await self._load_chapters_metadata(soup, metadata)
         except AttributeError as ex:
             raise DownloadException(reason="Couldn't obtain metadata", response=response, url=url) from ex
 
+        metadata.chapters = self._merge_chapters(cached_chapters, chapters)
+
         await metadata.save()
 
         return metadata
 
     @classmethod
-    async def _load_chapters_metadata(cls, soup: BeautifulSoup, working_dir: Path) -> list[ChapterMetadata]:
+    async def _load_chapters_metadata(cls, soup: BeautifulSoup, book: BookMetadata) -> list[ChapterMetadata]:
         try:
             chapters_list = soup.find("select", attrs={"name": "chapter"})
             if not isinstance(chapters_list, Tag):
@@ -104,69 +136,127 @@ class LitnetBookDownloader:
             chapters = [ChapterMetadata(chapter_id, chapter_title)]
 
         for meta in chapters:
-            meta.content_path = cls._compose_chapter_path(meta, working_dir)
+            meta.bind(book.working_dir, book.store)
 
         return chapters
 
-    async def _download_book_content(self, meta: BookMetadata) -> None:
-        headers = {"X-CSRF-Token": meta.csrf}
-        async with ClientSession(headers=headers, cookies=self._cookies) as session:
-            chapters = list(filter(lambda item: not item.downloaded, meta.chapters))
-            tasks = (self._download_chapter(session, chapter) for chapter in chapters)
-            await wait_for_all(*tasks)
-
-    async def _download_chapter(self, session: ClientSession, chapter: ChapterMetadata) -> None:
-        pages = await self._get_chapter_content(session, chapter)
-        await self._save_chapter_content(chapter, pages)
-
-    async def _get_chapter_content(self, session: ClientSession, chapter: ChapterMetadata) -> list[str]:
-        data = await self._get_chapter_data(session, chapter.id, 1)
-        if "data" not in data:
-            return []
+    @staticmethod
+    def _merge_chapters(cached: list[ChapterMetadata], actual: list[ChapterMetadata]) -> list[ChapterMetadata]:
+        """Keep already fetched data of the chapters that are still listed (even if they were retitled)."""
+        known = {chapter.id: chapter for chapter in cached}
+        for chapter in actual:
+            if previous := known.pop(chapter.id, None):
+                chapter.content_hash = previous.content_hash
+                chapter.text_hash = previous.text_hash
+                chapter.total_pages = previous.total_pages
+                chapter.pages = previous.pages
 
-        pages = [data["data"]]
-        for page_id in range(2, int(data["totalPages"]) + 1):
-            response = await self._get_chapter_data(session, chapter.id, page_id)
-            if "data" not in response:
-                return []
-            pages.append(response["data"])
+        for chapter in known.values():
+            chapter.discard()
 
-        print(f"chapter {chapter.title} is downloaded")
-        return pages
+        return actual
 
-    @classmethod
-    async def _save_chapter_content(cls, chapter: ChapterMetadata, pages: list[str]) -> None:
-        if not pages:
-            return
+    async def _download_book_content(self, meta: BookMetadata) -> None:
+        chapters = list(filter(lambda item: not item.downloaded, meta.chapters))
+        progress = BookProgress(
+            meta.author,
+            meta.title,
+            len(meta.chapters),
+            cached=len(meta.chapters) - len(chapters),
+            reporter=self._progress,
+        )
+        progress.start()
+        try:
+            tasks = (self._download_chapter(meta, chapter, progress) for chapter in chapters)
+            await wait_for_all(*tasks)
+        finally:
+            progress.finish()
 
-        temp_location = chapter.content_path.with_suffix(".download")
-        temp_location.parent.mkdir(parents=True, exist_ok=True)
-        async with open_file(temp_location, "w", encoding="utf-8") as file:
-            await file.writelines(pages)
-        temp_location.rename(chapter.content_path)
+    async def _download_chapter(self, meta: BookMetadata, chapter: ChapterMetadata, progress: BookProgress) -> None:
+        chapter.failure = ""
+        try:
+            with METRICS.timer("chapter_fetch_seconds"):
+                if await self._get_chapter_content(meta, chapter, progress):
+                    if not await chapter.assemble():
+                        chapter.failure = "fetched pages are damaged"
+            METRICS.count("chapters_downloaded" if chapter.downloaded else "chapters_failed")
+            progress.chapter_finished(chapter.downloaded)
+            await meta.record(chapter)
+        finally:
+            chapter.mark_ready()
+
+    async def _get_chapter_content(self, meta: BookMetadata, chapter: ChapterMetadata, progress: BookProgress) -> bool:
+        # pages left from a previous run are reused unless they don't match the manifest
+        await chapter.verify()
+        present = len(chapter.pages)
+
+        if 1 in chapter.missing_pages or not chapter.total_pages:
+            if await self._get_chapter_page(meta, chapter, 1, progress) is None:
+                return False
+        progress.chapter_sized(chapter.total_pages, present)
+
+        # the rest of the pages is fetched concurrently; every one of them is kept on disk,
+        # so a chapter that failed partially is resumed from the missing pages on the next run
+        tasks = (self._get_chapter_page(meta, chapter, page_id, progress) for page_id in chapter.missing_pages)
+        return None not in await wait_for_all(*tasks)
+
+    async def _get_chapter_page(
+        self, meta: BookMetadata, chapter: ChapterMetadata, page_id: int, progress: BookProgress
+    ) -> dict[str, Any] | None:
+        """Fetch and store a page; the reason of a failure is recorded in the chapter."""
+        try:
+            with METRICS.timer("page_fetch_seconds"):
+                response = await self._get_chapter_data(meta.csrf, chapter.id, page_id)
+        except DownloadException as ex:
+            METRICS.count("pages_failed")
+            chapter.failure = f"page {page_id}: {ex}"
+            return None
+
+        METRICS.count("pages_fetched")
+        if page_id == 1:
+            chapter.total_pages = response["totalPages"]
+        page = await chapter.save_page(page_id, response["data"])
+        await meta.record_page(chapter, page)
+        progress.page_fetched(len(response["data"].encode("utf-8")))
+        return response
 
     async def _get_book_index_page(self, url: str) -> str:
-        async with ClientSession(cookies=self._cookies) as session:
-            async with session.get(url) as response:
+        """Fetch the book page; it's the reachability check of the book url as well."""
+        try:
+            async with self._client.get(url, self._scheduler, cookies=self._cookies) as response:
+                if not response.ok:
+                    raise DownloadException(reason=f"url is unreachable (HTTP {response.status})", url=url)
                 return await response.text()
+        except (ClientError, TimeoutError) as ex:
+            raise DownloadException(reason="url is unreachable", url=url) from ex
 
-    @staticmethod
-    async def _get_chapter_data(session: ClientSession, chapter_id: str, page: int) -> dict[str, Any]:
-        url = "https://litnet.com/reader/get-page"
+    async def _get_chapter_data(self, csrf: str, chapter_id: str, page: int) -> dict[str, Any]:
+        url = f"{self._base_url}/reader/get-page"
         data = {"chapterId": chapter_id, "page": page}
+        headers = {"X-CSRF-Token": csrf}
 
-        wait_duration = randint(0, 2)
-        await sleep_for(wait_duration)
-        async with session.get(url, data=data) as response:
-            try:
-                page_data = await response.json(content_type="text/html; charset=utf-8")
-                return cast(dict[str, Any], page_data)
-            except ClientResponseError:
-                return dict()
-            except JSONDecodeError:
-                return dict()
-
-    @classmethod
-    def _compose_chapter_path(cls, chapter: ChapterMetadata, book_dir: Path) -> Path:
-        file_name = fingerprint(f"[{chapter.id}][{chapter.title}]")
-        return book_dir / "chapters" / file_name
+        try:
+            page_data = await self._client.get_json(
+                url,
+                self._scheduler,
+                content_type="text/html; charset=utf-8",
+                data=data,
+                headers=headers,
+                cookies=self._cookies,
+            )
+        except (ContentTypeError, JSONDecodeError) as ex:
+            raise DownloadException(reason="malformed page data", url=url) from ex
+        except ClientResponseError as ex:
+            raise DownloadException(reason=f"HTTP {ex.status}", url=url) from ex
+        except (ClientError, TimeoutError) as ex:
+            raise DownloadException(reason=str(ex) or type(ex).__name__, url=url) from ex
+
+        if not isinstance(page_data, dict) or not isinstance(page_data.get("data"), str):
+            raise DownloadException(reason="page content is missing", url=url)
+        if page == 1:
+            # the number of pages of the chapter comes with its first page
+            total_pages = page_data.get("totalPages")
+            if not str(total_pages).isdigit() or int(str(total_pages)) < 1:
+                raise DownloadException(reason="number of pages is missing", url=url)
+            page_data["totalPages"] = int(str(total_pages))
+        return cast(dict[str, Any], page_data)
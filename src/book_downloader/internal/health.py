@@ -0,0 +1,67 @@
+"""Non-blocking service health checks with cached results."""
+
+from asyncio import Task
+from asyncio import create_task
+from dataclasses import dataclass
+from http import HTTPStatus
+from time import monotonic
+
+from aiohttp import ClientError
+from aiohttp import ClientTimeout
+
+from book_downloader.internal.http_client import HttpClient
+
+
+@dataclass(frozen=True)
+class ProbeResult:
+    healthy: bool
+    latency: float = 0.0
+    error: str = ""
+
+
+async def probe_http(client: HttpClient, url: str, timeout: float = 5.0) -> ProbeResult:
+    """Check that the server answers a single HEAD request (no retries) without a server error."""
+    started = monotonic()
+    try:
+        async with client.session.head(url, timeout=ClientTimeout(total=timeout)) as response:
+            healthy = response.status < HTTPStatus.INTERNAL_SERVER_ERROR
+            error = "" if healthy else f"HTTP {response.status}"
+    except TimeoutError, ClientError:
+        return ProbeResult(healthy=False, latency=monotonic() - started, error="http request failed")
+
+    return ProbeResult(healthy=healthy, latency=monotonic() - started, error=error)
+
+
+class HealthMonitor:
+    """
+    Probes hosts with an HTTP HEAD request (it also warms up a pooled connection).
+
+    A result is cached for `ttl` seconds (`failure_ttl` for a failed probe), and simultaneous checks of a host
+    share a single probe, so many books of a batch don't probe the same host again and again. Hosts are given
+    as origins (`https://litnet.com`).
+    """
+
+    def __init__(self, client: HttpClient, ttl: float = 300.0, failure_ttl: float = 10.0, timeout: float = 5.0) -> None:
+        self._client = client
+        self._ttl = ttl
+        self._failure_ttl = failure_ttl
+        self._timeout = timeout
+
+        self._results: dict[str, tuple[ProbeResult, float]] = {}
+        self._probes: dict[str, Task[ProbeResult]] = {}
+
+    async def check(self, origin: str) -> ProbeResult:
+        cached = self._results.get(origin)
+        if cached and cached[1] > monotonic():
+            return cached[0]
+
+        probe = self._probes.get(origin)
+        if probe is None:
+            probe = create_task(probe_http(self._client, f"{origin}/", self._timeout))
+            self._probes[origin] = probe
+            probe.add_done_callback(lambda _: self._probes.pop(origin, None))
+
+        result = await probe
+        ttl = self._ttl if result.healthy else self._failure_ttl
+        self._results[origin] = (result, monotonic() + ttl)
+        return result
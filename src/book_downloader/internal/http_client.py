@@ -0,0 +1,220 @@
+"""Pooled HTTP client shared by every network operation of the application."""
+
+from asyncio import sleep as sleep_for
+from collections.abc import AsyncIterator
+from collections.abc import Sequence
+from contextlib import AbstractAsyncContextManager
+from contextlib import asynccontextmanager
+from contextlib import nullcontext
+from dataclasses import dataclass
+from dataclasses import field
+from datetime import UTC
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from http import HTTPStatus
+from json import JSONDecodeError
+from random import random
+from types import TracebackType
+from typing import Any
+
+from aiohttp import ClientConnectionError
+from aiohttp import ClientPayloadError
+from aiohttp import ClientResponse
+from aiohttp import ClientSession
+from aiohttp import ClientTimeout
+from aiohttp import TCPConnector
+from aiohttp import TraceConfig
+
+from book_downloader.internal.metrics import METRICS
+from book_downloader.internal.throttling import RequestScheduler
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Describes how failed requests (connection errors, timeouts and `statuses`) are repeated."""
+
+    attempts: int = 3
+    backoff: float = 0.5
+    max_delay: float = 30.0
+    jitter: float = 0.5
+    statuses: frozenset[int] = field(
+        default_factory=lambda: frozenset(
+            [
+                HTTPStatus.TOO_MANY_REQUESTS,
+                HTTPStatus.INTERNAL_SERVER_ERROR,
+                HTTPStatus.BAD_GATEWAY,
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                HTTPStatus.GATEWAY_TIMEOUT,
+            ]
+        )
+    )
+
+    def __post_init__(self) -> None:
+        if self.attempts < 1:
+            raise ValueError("attempts must be positive")
+        if not 0 <= self.jitter <= 1:
+            raise ValueError("jitter must be in [0, 1]")
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        """
+        Return the pause before the attempt following the failed `attempt` (counted from 1).
+
+        The pause grows exponentially and up to `jitter` part of it is random, so clients that failed together
+        don't retry together. The server's `Retry-After` wins if it asks for a longer pause (up to `max_delay`).
+        """
+        delay = min(self.backoff * 2 ** (attempt - 1), self.max_delay)
+        delay *= 1 - self.jitter * random()
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return float(delay)
+
+
+@dataclass(frozen=True)
+class HttpSettings:
+    connections_limit: int = 32
+    connections_per_host: int = 8
+    dns_cache_ttl: int = 300
+    connect_timeout: float = 10.0
+    timeout: float = 60.0
+    retry: RetryPolicy = field(default_factory=RetryPolicy)
+
+
+class HttpClient:
+    """
+    Wrapper around a single `aiohttp.ClientSession`.
+
+    Connections are pooled (with a per-host limit) and DNS answers are cached, so all requests to a host reuse
+    warm keep-alive connections. The session is opened by `async with client:` and closed on exit.
+    `trace_configs` let the caller observe every request (e.g. to measure latencies).
+    """
+
+    def __init__(self, settings: HttpSettings | None = None, trace_configs: Sequence[TraceConfig] = ()) -> None:
+        self._settings = settings or HttpSettings()
+        self._trace_configs = list(trace_configs)
+        self._session: ClientSession | None = None
+
+    @property
+    def session(self) -> ClientSession:
+        if self._session is None:
+            raise RuntimeError("http client isn't opened")
+        return self._session
+
+    async def __aenter__(self) -> HttpClient:
+        connector = TCPConnector(
+            limit=self._settings.connections_limit,
+            limit_per_host=self._settings.connections_per_host,
+            ttl_dns_cache=self._settings.dns_cache_ttl,
+        )
+        timeout = ClientTimeout(total=self._settings.timeout, connect=self._settings.connect_timeout)
+        self._session = ClientSession(connector=connector, timeout=timeout, trace_configs=self._trace_configs)
+        return self
+
+    async def __aexit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, traceback: TracebackType | None
+    ) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def get(
+        self, url: str, scheduler: RequestScheduler | None = None, **kwargs: Any
+    ) -> AbstractAsyncContextManager[ClientResponse]:
+        return self.request("GET", url, scheduler, **kwargs)
+
+    @asynccontextmanager
+    async def request(
+        self, method: str, url: str, scheduler: RequestScheduler | None = None, **kwargs: Any
+    ) -> AsyncIterator[ClientResponse]:
+        """
+        Perform a request according to the retry policy and provide the final response.
+
+        Every attempt goes through the `scheduler` (if any) and reports the response status to it.
+        Only sending the request and receiving the headers are retried; errors while the caller reads the body
+        aren't, use `get_json` when the body has to arrive intact.
+        """
+        policy = self._settings.retry
+        for attempt in range(1, policy.attempts + 1):
+            last_attempt = attempt == policy.attempts
+            async with scheduler.slot() if scheduler else nullcontext():
+                try:
+                    response, retry_after = await self._send(method, url, scheduler, **kwargs)
+                except ClientConnectionError, TimeoutError:
+                    if last_attempt:
+                        raise
+                    retry_after = None
+                else:
+                    if last_attempt or response.status not in policy.statuses:
+                        try:
+                            yield response
+                        finally:
+                            response.release()
+                        return
+
+                    response.release()
+
+            METRICS.count("http_retries")
+            await sleep_for(policy.delay(attempt, retry_after))
+
+    async def get_json(
+        self, url: str, scheduler: RequestScheduler | None = None, content_type: str = "application/json", **kwargs: Any
+    ) -> Any:
+        """
+        Perform a GET request according to the retry policy and return the decoded JSON body.
+
+        Unlike `request`, reading and decoding the body is a part of the attempt: a body cut short, a timeout while
+        it arrives or a malformed document are retried like connection errors. An error status of the final attempt
+        raises `ClientResponseError`.
+        """
+        policy = self._settings.retry
+        attempt = 1
+        while True:
+            last_attempt = attempt == policy.attempts
+            retry_after = None
+            async with scheduler.slot() if scheduler else nullcontext():
+                try:
+                    response, retry_after = await self._send("GET", url, scheduler, **kwargs)
+                    async with response:
+                        if last_attempt or response.status not in policy.statuses:
+                            response.raise_for_status()
+                            return await response.json(content_type=content_type)
+                except ClientConnectionError, ClientPayloadError, TimeoutError, JSONDecodeError:
+                    if last_attempt:
+                        raise
+
+            METRICS.count("http_retries")
+            await sleep_for(policy.delay(attempt, retry_after))
+            attempt += 1
+
+    async def _send(
+        self, method: str, url: str, scheduler: RequestScheduler | None, **kwargs: Any
+    ) -> tuple[ClientResponse, float | None]:
+        """Send a single request; return the response (headers received) and its `Retry-After` delay."""
+        METRICS.count("http_requests")
+        response = await self.session.request(method, url, **kwargs)
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if retry_after is not None:
+            retry_after = min(retry_after, self._settings.retry.max_delay)
+        if scheduler:
+            scheduler.feedback(response.status, retry_after)
+        if response.status == HTTPStatus.TOO_MANY_REQUESTS:
+            METRICS.count("http_throttled")
+        return response, retry_after
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Convert `Retry-After` header value (delay in seconds or HTTP date) into seconds."""
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        moment = parsedate_to_datetime(value)
+    except TypeError, ValueError:
+        return None
+
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=UTC)
+    return max((moment - datetime.now(UTC)).total_seconds(), 0.0)
@@ -1,51 +1,292 @@
 """Contains data classes that represent book-related metadata."""
 
+from asyncio import Event
+from asyncio import Lock
+from collections.abc import Iterable
 from dataclasses import dataclass
 from dataclasses import field
+from enum import StrEnum
+from enum import auto
 from json import JSONDecodeError
 from json import dumps
 from json import loads
+from marshal import dumps as marshal_dumps
+from marshal import loads as marshal_loads
+from os import fsync
 from pathlib import Path
+from time import time
 from typing import Any
 
 from aiofiles import open
 
+from book_downloader.internal.asyncio import run_async
+from book_downloader.internal.blob_store import ChapterStore
+from book_downloader.internal.misc import fingerprint
+from book_downloader.internal.misc import remove_directory
+from book_downloader.internal.misc import write_atomically
+
+# layout of the stored parsed texts; bump it whenever the layout or the paragraph extraction changes,
+# so the texts stored before are parsed again
+_TEXT_VERSION = 1
+
+# the journal is compacted into the snapshot once it has that many records
+_JOURNAL_LIMIT = 256
+
+
+def parsed_text_key(chapter_id: str) -> str:
+    """Key of the paragraphs parsed out of the chapter's content in the chapter store."""
+    return f"{chapter_id}#text"
+
+
+class Integrity(StrEnum):
+    """Result of a cached chapter verification."""
+
+    complete = auto()
+    partial = auto()
+    missing = auto()
+    corrupted = auto()
+
+
+@dataclass
+class PageMetadata:
+    index: int
+    size: int
+    hash: str
+    fetched_at: float = 0.0
+
+    @classmethod
+    def describe(cls, index: int, content: bytes) -> PageMetadata:
+        return cls(index=index, size=len(content), hash=fingerprint(content), fetched_at=time())
+
+    def matches(self, content: bytes) -> bool:
+        return len(content) == self.size and fingerprint(content) == self.hash
+
+    def to_json(self) -> dict[str, Any]:
+        json = dict(index=self.index, size=self.size, hash=self.hash, fetched_at=self.fetched_at)
+        return json
+
 
 @dataclass
 class ChapterMetadata:
     id: str
     title: str
-    content_path: Path = field(default_factory=Path)
+    content_hash: str = ""
+    total_pages: int = 0
+    pages: list[PageMetadata] = field(default_factory=list)
+    text_hash: str = ""
+
+    failure: str = field(default="", init=False, repr=False, compare=False)
+    _ready: Event = field(default_factory=Event, init=False, repr=False, compare=False)
+    _store: ChapterStore | None = field(default=None, init=False, repr=False, compare=False)
+    _pages_root: Path = field(default_factory=Path, init=False, repr=False, compare=False)
 
     def __post_init__(self) -> None:
-        if not isinstance(self.content_path, Path):
-            self.content_path = Path(self.content_path)
+        self.pages = [page if isinstance(page, PageMetadata) else PageMetadata(**page) for page in self.pages]
+
+    def bind(self, book_dir: Path, store: ChapterStore) -> None:
+        """Attach the chapter to the places its data is kept in."""
+        self._pages_root = book_dir / "chapters"
+        self._store = store
+
+    @property
+    def store(self) -> ChapterStore:
+        if self._store is None:
+            raise RuntimeError("chapter isn't bound to a store")
+        return self._store
 
     @property
     def downloaded(self) -> bool:
-        return self.content_path.exists() and self.content_path.is_file()
+        return self.store.contains(self.content_hash)
+
+    @property
+    def pages_dir(self) -> Path:
+        """Location of the pages of a chapter that isn't assembled yet (named by id, so retitling keeps them)."""
+        return self._pages_root / f"{fingerprint(self.id)}.pages"
+
+    @property
+    def missing_pages(self) -> list[int]:
+        fetched = {page.index for page in self.pages}
+        return [index for index in range(1, self.total_pages + 1) if index not in fetched]
+
+    def mark_ready(self) -> None:
+        """Signal that downloading of the chapter is over (whether it succeeded or not)."""
+        self._ready.set()
+
+    async def wait_ready(self) -> None:
+        await self._ready.wait()
 
     async def load_content(self) -> str:
-        if not self.downloaded:
-            return ""
+        content = await self.store.get(self.content_hash)
+        return content.decode("utf-8") if content is not None else ""
+
+    async def load_text(self) -> list[str] | None:
+        """Return the paragraphs parsed out of the current content before or None if it has to be parsed."""
+        data = await self.store.get(self.text_hash) if self.text_hash and self.content_hash else None
+        if data is None or fingerprint(data) != self.text_hash:
+            return None
+
+        try:
+            version, content_hash, paragraphs = marshal_loads(data)
+        except EOFError, ValueError, TypeError:
+            return None
+
+        if version != _TEXT_VERSION or content_hash != self.content_hash or not isinstance(paragraphs, list):
+            return None
+        return paragraphs
+
+    async def keep_text(self, paragraphs: list[str]) -> None:
+        """Store the paragraphs parsed out of the content, so the next export doesn't parse it again."""
+        if self.content_hash:
+            data = marshal_dumps((_TEXT_VERSION, self.content_hash, paragraphs))
+            self.text_hash = await self.store.put(parsed_text_key(self.id), data)
+
+    async def restore(self) -> bool:
+        """Take the chapter from the store if it was downloaded before (by this or any other book)."""
+        digest = await self.store.lookup(self.id)
+        if not digest:
+            return False
 
-        async with open(self.content_path, encoding="utf-8") as file:
-            return await file.read()
+        self.content_hash = digest
+        remove_directory(self.pages_dir)
+        self.pages.clear()
+        return True
+
+    async def save_page(self, index: int, content: str) -> PageMetadata:
+        data = content.encode("utf-8")
+        await write_atomically(self.pages_dir / str(index), data)
+
+        page = PageMetadata.describe(index, data)
+        self.add_page(page)
+        return page
+
+    def add_page(self, page: PageMetadata) -> None:
+        self._forget_page(page.index)
+        self.pages.append(page)
+        self.pages.sort(key=lambda item: item.index)
+
+    async def assemble(self) -> bool:
+        """Join the fetched pages into the stored chapter text; return False if some pages are missing or damaged."""
+        if not self.total_pages or self.missing_pages:
+            return False
+
+        parts = [await self._load_page(page) for page in self.pages]
+        if None in parts:
+            return False
+
+        self.content_hash = await self.store.put(self.id, b"".join(part for part in parts if part is not None))
+        remove_directory(self.pages_dir)
+        self.pages.clear()
+        return True
+
+    async def verify(self) -> Integrity:
+        """Check cached data against the manifest; damaged data is dropped so it gets fetched again."""
+        if self.content_hash:
+            return await self._verify_content()
+
+        for page in list(self.pages):
+            if await self._load_page(page) is None:
+                self._forget_page(page.index)
+
+        if not self.pages:
+            return Integrity.missing
+        return Integrity.partial
+
+    def discard(self) -> None:
+        """Forget all cached data of the chapter (the stored text stays, other books may refer to it)."""
+        self.content_hash = ""
+        self.text_hash = ""
+        remove_directory(self.pages_dir)
+        self.total_pages = 0
+        self.pages.clear()
 
     def to_json(self) -> dict[str, Any]:
-        json = dict(id=self.id, title=self.title, content_path=str(self.content_path))
+        json = dict(
+            id=self.id,
+            title=self.title,
+            content_hash=self.content_hash,
+            total_pages=self.total_pages,
+            pages=[page.to_json() for page in self.pages],
+            text_hash=self.text_hash,
+        )
         return json
 
+    async def _verify_content(self) -> Integrity:
+        content = await self.store.get(self.content_hash)
+        if content is not None and fingerprint(content) == self.content_hash:
+            return Integrity.complete
+
+        if self.store.contains(self.content_hash):
+            self.store.remove(self.content_hash)
+            state = Integrity.corrupted
+        else:
+            state = Integrity.missing
+        self.content_hash = ""
+        return state
+
+    async def migrate(self, legacy_path: Path) -> None:
+        """Move the text of a chapter cached by a previous version (a file per book) into the store."""
+        if legacy_path.is_file() and not self.content_hash:
+            async with open(legacy_path, "rb") as file:
+                self.content_hash = await self.store.put(self.id, await file.read())
+            self.pages.clear()
+
+        legacy_path.unlink(missing_ok=True)
+        remove_directory(legacy_path.with_suffix(".pages"))
+
+    async def _load_page(self, page: PageMetadata) -> bytes | None:
+        page_path = self.pages_dir / str(page.index)
+        if not page_path.is_file():
+            return None
+
+        async with open(page_path, "rb") as file:
+            content = await file.read()
+
+        return content if page.matches(content) else None
+
+    def _forget_page(self, index: int) -> None:
+        self.pages = [page for page in self.pages if page.index != index]
+
+
+@dataclass
+class ChaptersDiff:
+    """Difference between two revisions of a book's table of contents."""
+
+    added: list[ChapterMetadata] = field(default_factory=list)
+    removed: list[ChapterMetadata] = field(default_factory=list)
+    retitled: list[tuple[ChapterMetadata, ChapterMetadata]] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return any([self.added, self.removed, self.retitled])
+
+    @classmethod
+    def compare(cls, before: list[ChapterMetadata], after: list[ChapterMetadata]) -> ChaptersDiff:
+        previous = {chapter.id: chapter for chapter in before}
+        actual = {chapter.id: chapter for chapter in after}
+
+        diff = cls()
+        diff.added = [chapter for chapter in after if chapter.id not in previous]
+        diff.removed = [chapter for chapter in before if chapter.id not in actual]
+        diff.retitled = [
+            (previous[chapter.id], chapter)
+            for chapter in after
+            if chapter.id in previous and previous[chapter.id].title != chapter.title
+        ]
+        return diff
+
 
 @dataclass
 class BookMetadata:
     working_dir: Path
+    store: ChapterStore
 
     csrf: str = ""
     author: str = ""
     title: str = ""
     chapters: list[ChapterMetadata] = field(default_factory=list)
 
+    _lock: Lock = field(default_factory=Lock, init=False, repr=False, compare=False)
+    _journaled: int = field(default=0, init=False, repr=False, compare=False)
+
     @property
     def completed(self) -> bool:
         return all([self.csrf, self.author, self.title, self.chapters])
@@ -54,11 +295,22 @@ class BookMetadata:
     def file_path(self) -> Path:
         return self.working_dir / "metadata.json"
 
+    @property
+    def journal_path(self) -> Path:
+        return journal_path(self.working_dir)
+
     async def save(self) -> None:
-        async with open(self.file_path, "w", encoding="utf-8") as file:
-            json = dumps(self.to_json(), sort_keys=True, indent=4)
-            await file.write(json)
-            await file.flush()
+        """Write the whole state into the snapshot (atomically replaced) and start the journal over."""
+        async with self._lock:
+            await self._write_snapshot()
+
+    async def record(self, chapter: ChapterMetadata) -> None:
+        """Persist the current state of the chapter (e.g. it's assembled or its parsed text is kept)."""
+        await self._append(dict(chapter=chapter.to_json()))
+
+    async def record_page(self, chapter: ChapterMetadata, page: PageMetadata) -> None:
+        """Persist a fetched page of the chapter, so a resumed download doesn't fetch it again."""
+        await self._append(dict(chapter_id=chapter.id, total_pages=chapter.total_pages, page=page.to_json()))
 
     async def load(self) -> bool:
         if not self.file_path.exists():
@@ -71,13 +323,54 @@ class BookMetadata:
             except JSONDecodeError:
                 return False
 
+        damaged_journal = False
+        if self.journal_path.is_file():
+            async with open(self.journal_path, encoding="utf-8") as file:
+                journal = await file.read()
+            lines = journal.splitlines()
+            self._journaled = replay_journal(json, lines)
+            # the next record mustn't be glued to a line torn by a crash, so such a journal is compacted right away
+            damaged_journal = self._journaled < len(lines) or journal[-1:] not in ("", "\n")
+
         self.csrf = json.get("csrf", "")
         self.author = json.get("author", "")
         self.title = json.get("title", "")
-        self.chapters = [ChapterMetadata(**item) for item in json.get("chapters", [])]
+        self.chapters = []
+        legacy = False
+        for item in json.get("chapters", []):
+            legacy_path = item.pop("content_path", None)
+            chapter = ChapterMetadata(**item)
+            chapter.bind(self.working_dir, self.store)
+            if legacy_path is not None:
+                # the book directory might have been renamed since, so only the file name is reliable
+                await chapter.migrate(self.working_dir / "chapters" / Path(legacy_path).name)
+                legacy = True
+            self.chapters.append(chapter)
+
+        if legacy or damaged_journal:
+            await self.save()
 
         return True
 
+    async def _append(self, record: dict[str, Any]) -> None:
+        async with self._lock:
+            if not self.file_path.is_file() or self._journaled >= _JOURNAL_LIMIT:
+                await self._write_snapshot()
+                return
+
+            async with open(self.journal_path, "a", encoding="utf-8") as file:
+                await file.write(dumps(record, separators=(",", ":")) + "\n")
+                await file.flush()
+                await run_async(fsync, file.fileno())
+            self._journaled += 1
+
+    async def _write_snapshot(self) -> None:
+        json = dumps(self.to_json(), sort_keys=True, separators=(",", ":"))
+        await write_atomically(self.file_path, json.encode("utf-8"))
+        # a journal left by a crash right here is replayed over the snapshot it's already part of, which is harmless
+        self.journal_path.unlink(missing_ok=True)
+        self._journaled = 0
+
     def to_json(self) -> dict[str, Any]:
         json = dict(
             csrf=self.csrf,
@@ -86,3 +379,50 @@ class BookMetadata:
             chapters=[chapter.to_json() for chapter in self.chapters],
         )
         return json
+
+
+def journal_path(book_dir: Path) -> Path:
+    return book_dir / "metadata.journal"
+
+
+def replay_journal(json: dict[str, Any], lines: Iterable[str]) -> int:
+    """
+    Apply the journal records to the snapshot's JSON; return the number of applied records.
+
+    A record either replaces the whole state of a chapter or adds a fetched page to it. Records are idempotent,
+    and a line torn by a crash (only the last one may be) is skipped; it doesn't count as applied.
+    """
+    chapters = {chapter.get("id"): chapter for chapter in json.get("chapters", []) if isinstance(chapter, dict)}
+    applied = 0
+    for line in lines:
+        try:
+            record = loads(line)
+        except JSONDecodeError:
+            continue
+
+        if "chapter" in record:
+            chapter = chapters.get(record["chapter"].get("id"))
+            if chapter is not None:
+                chapter.update(record["chapter"])
+        elif chapter := chapters.get(record.get("chapter_id")):
+            chapter["total_pages"] = record["total_pages"]
+            pages = [page for page in chapter.get("pages", []) if page.get("index") != record["page"]["index"]]
+            chapter["pages"] = sorted([*pages, record["page"]], key=lambda page: page["index"])
+        applied += 1
+    return applied
+
+
+def read_manifest(book_dir: Path) -> dict[str, Any]:
+    """Read the book's metadata JSON with the journal applied (synchronously, for the cache maintenance)."""
+    try:
+        json = loads((book_dir / "metadata.json").read_text(encoding="utf-8"))
+    except FileNotFoundError, JSONDecodeError:
+        return {}
+    if not isinstance(json, dict):
+        return {}
+
+    try:
+        replay_journal(json, journal_path(book_dir).read_text(encoding="utf-8").splitlines())
+    except FileNotFoundError:
+        pass
+    return json
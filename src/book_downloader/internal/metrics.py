@@ -0,0 +1,149 @@
+"""Counters and latency histograms of a run; reported as JSON or in the Prometheus text format."""
+
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import AsyncIterator
+from collections.abc import Iterator
+from contextlib import asynccontextmanager
+from contextlib import contextmanager
+from dataclasses import dataclass
+from dataclasses import field
+from math import inf
+from time import monotonic
+from time import perf_counter
+from typing import Any
+
+from aiohttp.web import Application
+from aiohttp.web import AppRunner
+from aiohttp.web import Request
+from aiohttp.web import Response
+from aiohttp.web import TCPSite
+
+# upper bounds (seconds) of the histogram buckets; they cover a local page request as well as a whole book
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, inf)
+
+
+@dataclass
+class Histogram:
+    buckets: tuple[float, ...] = LATENCY_BUCKETS
+    counts: list[int] = field(init=False)
+    count: int = 0
+    sum: float = 0.0
+    min: float = inf
+    max: float = 0.0
+
+    def __post_init__(self) -> None:
+        self.counts = [0] * len(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.counts[min(bisect_left(self.buckets, value), len(self.buckets) - 1)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, share: float) -> float:
+        """Estimate the quantile as the upper bound of its bucket (never beyond the largest observed value)."""
+        if not self.count:
+            return 0.0
+
+        rank = share * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts, strict=True):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_json(self) -> dict[str, Any]:
+        json = dict(
+            count=self.count,
+            sum=round(self.sum, 6),
+            mean=round(self.sum / self.count, 6) if self.count else 0.0,
+            min=round(self.min, 6) if self.count else 0.0,
+            max=round(self.max, 6),
+            p50=round(self.quantile(0.5), 6),
+            p95=round(self.quantile(0.95), 6),
+            p99=round(self.quantile(0.99), 6),
+        )
+        return json
+
+
+class Metrics:
+    """
+    Registry of named counters and histograms; they're created on first use.
+
+    Durations are measured in seconds. Names follow the Prometheus conventions (`pages_fetched`,
+    `page_fetch_seconds`); counters are exposed with the `_total` suffix.
+    """
+
+    def __init__(self) -> None:
+        self._counters: Counter[str] = Counter()
+        self._histograms: dict[str, Histogram] = {}
+        self._started = monotonic()
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self._counters[name] += amount
+
+    def observe(self, name: str, value: float) -> None:
+        if name not in self._histograms:
+            self._histograms[name] = Histogram()
+        self._histograms[name].observe(value)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Observe the duration of the block (whether it succeeds or not)."""
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - started)
+
+    def to_json(self) -> dict[str, Any]:
+        json = dict(
+            elapsed=round(monotonic() - self._started, 3),
+            counters=dict(sorted(self._counters.items())),
+            histograms={name: self._histograms[name].to_json() for name in sorted(self._histograms)},
+        )
+        return json
+
+    def to_prometheus(self, prefix: str = "book_downloader") -> str:
+        lines = []
+        for name, value in sorted(self._counters.items()):
+            lines += [f"# TYPE {prefix}_{name}_total counter", f"{prefix}_{name}_total {value}"]
+
+        for name, histogram in sorted(self._histograms.items()):
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts, strict=True):
+                cumulative += count
+                le = "+Inf" if bound == inf else repr(bound)
+                lines.append(f'{prefix}_{name}_bucket{{le="{le}"}} {cumulative}')
+            lines += [f"{prefix}_{name}_sum {histogram.sum!r}", f"{prefix}_{name}_count {histogram.count}"]
+
+        return "\n".join(lines) + "\n"
+
+
+# metrics of the whole process; every instrumented component reports there
+METRICS = Metrics()
+
+
+@asynccontextmanager
+async def serve_metrics(port: int, host: str = "127.0.0.1", metrics: Metrics = METRICS) -> AsyncIterator[None]:
+    """Expose the metrics at `http://host:port/metrics` in the Prometheus text format while the block runs."""
+
+    async def handle(request: Request) -> Response:
+        return Response(
+            body=metrics.to_prometheus().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    app = Application()
+    app.router.add_get("/metrics", handle)
+    runner = AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await TCPSite(runner, host, port).start()
+        yield
+    finally:
+        await runner.cleanup()
@@ -1,13 +1,22 @@
 """Holds small and handy miscellaneous."""
 
 from hashlib import sha256
+from os import fsync
 from pathlib import Path
+from re import compile
+from secrets import token_hex
 from shutil import rmtree
 
+from aiofiles import open
 
-def fingerprint(data: str) -> str:
+from book_downloader.internal.asyncio import run_async
+
+
+def fingerprint(data: str | bytes) -> str:
     """Returns some kind of hash."""
-    return sha256(data.encode("utf-8")).hexdigest()
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return sha256(data).hexdigest()
 
 
 def ensure_directory_exists(path: Path) -> None:
@@ -18,3 +27,66 @@ def ensure_directory_exists(path: Path) -> None:
 def remove_directory(path: Path) -> None:
     """Recursively deletes a directory tree (ignores any errors)."""
     rmtree(path, ignore_errors=True)
+
+
+async def write_atomically(path: Path, content: bytes) -> None:
+    """
+    Write the file via a temporary one, so readers never see a half-written file. The content reaches the disk
+    before the file is renamed, so a power loss leaves either the previous file or the new one, never an empty one.
+    """
+    temp_location = path.with_name(f"{path.name}.{token_hex(4)}.download")
+    temp_location.parent.mkdir(parents=True, exist_ok=True)
+    async with open(temp_location, "wb") as file:
+        await file.write(content)
+        await file.flush()
+        await run_async(fsync, file.fileno())
+    temp_location.replace(path)
+
+
+def sanitize_filename_part(value: str) -> str:
+    """Replace the characters that aren't allowed in file names; never returns an empty string."""
+    invalid_chars = '<>:"/\\|?*'
+    sanitized = "".join("_" if (ch in invalid_chars or ord(ch) < 32) else ch for ch in value)
+    sanitized = sanitized.strip(" .")
+
+    if not sanitized:
+        return "unknown"
+
+    return sanitized
+
+
+# characters XML 1.0 doesn't allow even as references
+_INVALID_XML_CHARS = compile("[^\x09\x0a\x0d\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]")
+
+
+def remove_invalid_xml_chars(text: str) -> str:
+    """Drop the characters that can't appear in an XML document (e.g. form feeds pasted into a chapter)."""
+    return _INVALID_XML_CHARS.sub("", text)
+
+
+def directory_size(path: Path) -> int:
+    """Total size of the files under the directory (0 if it doesn't exist)."""
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
+
+
+_SIZE_UNITS = {"": 1, "K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+
+
+def parse_size(text: str) -> int:
+    """Convert a human-readable size (`1500`, `500M`, `2G`, `1.5GiB`) into bytes."""
+    value = text.strip().upper().removesuffix("IB").removesuffix("B")
+    unit = value[-1:] if value[-1:] in _SIZE_UNITS else ""
+    number = float(value.removesuffix(unit) or "nan")
+    if not number >= 0:
+        raise ValueError(f"invalid size: {text!r}")
+    return int(number * _SIZE_UNITS[unit])
+
+
+def format_size(size: int) -> str:
+    """Convert bytes into a human-readable size."""
+    value = float(size)
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if value < 1024:
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TiB"
@@ -0,0 +1,145 @@
+"""Single-file storage of the chapter texts of a book, read through a memory map."""
+
+from asyncio import Lock
+from dataclasses import dataclass
+from json import JSONDecodeError
+from json import dumps
+from json import loads
+from mmap import ACCESS_READ
+from mmap import mmap
+from pathlib import Path
+from typing import BinaryIO
+
+from aiofiles import open
+
+from book_downloader.internal.compressors import DECOMPRESSION_ERRORS
+from book_downloader.internal.compressors import Compression
+from book_downloader.internal.misc import fingerprint
+
+
+@dataclass(frozen=True)
+class PackEntry:
+    offset: int
+    size: int
+    compression: Compression
+
+
+class PackStore:
+    """
+    Keeps the chapter texts of one book in an append-only data file (`chapters.pack`) and the offsets of them
+    in an index (`chapters.idx`, a JSON object per line), so a book is two files however many chapters it has.
+
+    Texts are read from a memory map of the data file, so reading a chapter costs no system calls. The index
+    line is appended only after the data, so a broken write leaves unreachable bytes, never a broken chapter.
+    Removed texts are marked in the index; their bytes are reclaimed when the book leaves the cache.
+    """
+
+    def __init__(self, book_dir: Path, compression: Compression = Compression.none) -> None:
+        self._data_path = book_dir / "chapters.pack"
+        self._index_path = book_dir / "chapters.idx"
+        self._compression = compression
+
+        self._entries: dict[str, PackEntry] | None = None
+        self._keys: dict[str, str] = {}
+        self._lock = Lock()
+        self._file: BinaryIO | None = None
+        self._map: mmap | None = None
+
+    @staticmethod
+    def exists(book_dir: Path) -> bool:
+        return (book_dir / "chapters.idx").is_file()
+
+    def contains(self, digest: str) -> bool:
+        return digest in self._load()
+
+    async def put(self, key: str, content: bytes) -> str:
+        """Store the content of the chapter identified by `key` and return its hash."""
+        digest = fingerprint(content)
+        async with self._lock:
+            entries = self._load()
+            record: dict[str, object] = {"key": key, "digest": digest}
+            if digest not in entries:
+                data = self._compression.compress(content)
+                offset = self._data_path.stat().st_size if self._data_path.exists() else 0
+                async with open(self._data_path, "ab") as file:
+                    await file.write(data)
+                entries[digest] = PackEntry(offset, len(data), self._compression)
+                record.update(offset=offset, size=len(data), compression=str(self._compression))
+
+            await self._append_record(record)
+            self._keys[key] = digest
+        return digest
+
+    async def get(self, digest: str) -> bytes | None:
+        """Return the content of the chapter text or None if it isn't stored or can't be decompressed."""
+        entry = self._load().get(digest)
+        if entry is None:
+            return None
+        if not entry.size:
+            # an empty text might have nothing to map: a file of zero length can't be memory mapped
+            return b""
+
+        memory = self._mapping(entry.offset + entry.size)
+        try:
+            return entry.compression.decompress(memory[entry.offset : entry.offset + entry.size])
+        except DECOMPRESSION_ERRORS:
+            return None
+
+    async def lookup(self, key: str) -> str:
+        """Return the hash of the stored content of the chapter identified by `key` or an empty string."""
+        self._load()
+        digest = self._keys.get(key, "")
+        return digest if self.contains(digest) else ""
+
+    def remove(self, digest: str) -> None:
+        if self._load().pop(digest, None) is None:
+            return
+
+        with self._index_path.open("a", encoding="utf-8") as file:
+            file.write(dumps({"digest": digest, "removed": True}) + "\n")
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _load(self) -> dict[str, PackEntry]:
+        if self._entries is not None:
+            return self._entries
+
+        self._entries = {}
+        if not self._index_path.is_file():
+            return self._entries
+
+        data_size = self._data_path.stat().st_size if self._data_path.exists() else 0
+        for line in self._index_path.read_text(encoding="utf-8").splitlines():
+            try:
+                record = loads(line)
+            except JSONDecodeError:
+                continue  # the last line of an interrupted write
+
+            digest = record.get("digest", "")
+            if record.get("removed"):
+                self._entries.pop(digest, None)
+                continue
+
+            if "offset" in record and record["offset"] + record["size"] <= data_size:
+                self._entries[digest] = PackEntry(record["offset"], record["size"], Compression(record["compression"]))
+            if "key" in record:
+                self._keys[record["key"]] = digest
+        return self._entries
+
+    async def _append_record(self, record: dict[str, object]) -> None:
+        async with open(self._index_path, "a", encoding="utf-8") as file:
+            await file.write(dumps(record) + "\n")
+
+    def _mapping(self, size: int) -> mmap:
+        """Return a memory map of the data file that is at least `size` bytes long."""
+        if self._map is None or len(self._map) < size:
+            self.close()
+            self._file = self._data_path.open("rb")
+            self._map = mmap(self._file.fileno(), 0, access=ACCESS_READ)
+        return self._map
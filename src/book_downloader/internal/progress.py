@@ -0,0 +1,213 @@
+"""Download progress of books: totals come from the metadata, the rates are measured while pages arrive."""
+
+from dataclasses import dataclass
+from dataclasses import field
+from enum import StrEnum
+from enum import auto
+from json import dumps
+from sys import stderr
+from time import monotonic
+from typing import Any
+from typing import Protocol
+from typing import TextIO
+
+from book_downloader.internal.misc import format_size
+
+
+class ProgressMode(StrEnum):
+    auto = "auto"
+    bar = "bar"
+    json = "json"
+    none = "none"
+
+
+class ProgressEvent(StrEnum):
+    started = auto()
+    page = auto()
+    chapter = auto()
+    finished = auto()
+
+
+class ProgressReporter(Protocol):
+    def report(self, book: BookProgress, event: ProgressEvent) -> None:
+        """Show the change of the book's progress."""
+
+
+class NoProgress:
+    def report(self, book: BookProgress, event: ProgressEvent) -> None:
+        pass
+
+
+@dataclass
+class BookProgress:
+    """
+    Progress of downloading a single book.
+
+    Chapters taken from the cache are done from the start. The number of pages of a chapter is known once its
+    first page arrives, so the remaining pages of the chapters nobody has looked into yet are estimated by
+    the average size of the chapters seen so far.
+    """
+
+    author: str
+    title: str
+    chapters: int
+    cached: int = 0
+    reporter: ProgressReporter = field(default_factory=NoProgress, repr=False, compare=False)
+
+    chapters_done: int = 0
+    chapters_failed: int = 0
+    chapters_sized: int = 0  # chapters to download whose number of pages is known
+    pages: int = 0  # pages of the sized chapters
+    pages_done: int = 0  # including the pages left on disk by a previous run
+    pages_fetched: int = 0
+    bytes_fetched: int = 0
+    started: float = field(default_factory=monotonic)
+    finished: float = 0.0
+
+    def __post_init__(self) -> None:
+        self.chapters_done = self.cached
+
+    def start(self) -> None:
+        self.reporter.report(self, ProgressEvent.started)
+
+    def chapter_sized(self, pages: int, present: int) -> None:
+        """Record the number of pages of a chapter and how many of them are fetched already."""
+        self.chapters_sized += 1
+        self.pages += pages
+        self.pages_done += present
+
+    def page_fetched(self, size: int) -> None:
+        self.pages_done += 1
+        self.pages_fetched += 1
+        self.bytes_fetched += size
+        self.reporter.report(self, ProgressEvent.page)
+
+    def chapter_finished(self, downloaded: bool) -> None:
+        if downloaded:
+            self.chapters_done += 1
+        else:
+            self.chapters_failed += 1
+        self.reporter.report(self, ProgressEvent.chapter)
+
+    def finish(self) -> None:
+        self.finished = monotonic()
+        self.reporter.report(self, ProgressEvent.finished)
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or monotonic()) - self.started
+
+    @property
+    def pages_per_second(self) -> float:
+        return self.pages_fetched / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes_fetched / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def estimated_pages(self) -> int:
+        """Pages of all chapters being downloaded, the unsized ones are estimated."""
+        unsized = self.chapters - self.cached - self.chapters_sized
+        if not unsized:
+            return self.pages
+        average = self.pages / self.chapters_sized if self.chapters_sized else 1.0
+        return self.pages + round(unsized * average)
+
+    @property
+    def eta(self) -> float | None:
+        """Seconds left at the measured page rate; None while nothing is measured yet."""
+        if self.finished:
+            return 0.0
+        rate = self.pages_per_second
+        if not rate:
+            return None
+        return max(self.estimated_pages - self.pages_done, 0) / rate
+
+    def to_json(self) -> dict[str, Any]:
+        eta = self.eta
+        json = dict(
+            author=self.author,
+            title=self.title,
+            chapters=self.chapters,
+            chapters_done=self.chapters_done,
+            chapters_failed=self.chapters_failed,
+            pages=self.estimated_pages,
+            pages_done=self.pages_done,
+            bytes=self.bytes_fetched,
+            elapsed=round(self.elapsed, 3),
+            pages_per_second=round(self.pages_per_second, 3),
+            bytes_per_second=round(self.bytes_per_second, 1),
+            eta=round(eta, 1) if eta is not None else None,
+        )
+        return json
+
+
+def format_duration(seconds: float | None) -> str:
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes:02}:{seconds:02}"
+
+
+class ProgressBar:
+    """Single-line progress bar redrawn in place (at most every `interval` seconds)."""
+
+    def __init__(self, stream: TextIO = stderr, width: int = 30, interval: float = 0.1) -> None:
+        self._stream = stream
+        self._width = width
+        self._interval = interval
+        self._drawn_at = 0.0
+        self._line_length = 0
+
+    def report(self, book: BookProgress, event: ProgressEvent) -> None:
+        now = monotonic()
+        if event is ProgressEvent.page and now - self._drawn_at < self._interval:
+            return
+        self._drawn_at = now
+
+        line = self.render(book)
+        self._stream.write("\r" + line.ljust(self._line_length))
+        self._line_length = len(line)
+        if event is ProgressEvent.finished:
+            self._stream.write("\n")
+            self._line_length = 0
+        self._stream.flush()
+
+    def render(self, book: BookProgress) -> str:
+        total = book.estimated_pages + book.cached
+        done = book.pages_done + book.cached
+        share = min(done / total, 1.0) if total else float(bool(book.finished))
+        filled = round(share * self._width)
+
+        text = (
+            f"[{'#' * filled}{'-' * (self._width - filled)}] {share:4.0%}  "
+            f"{book.chapters_done}/{book.chapters} chapters  {book.pages_done}/{book.estimated_pages} pages  "
+            f"{book.pages_per_second:.1f} pages/s  {format_size(round(book.bytes_per_second))}/s  "
+        )
+        if book.chapters_failed:
+            text += f"{book.chapters_failed} failed  "
+        if book.finished:
+            return text + f"done in {format_duration(book.elapsed)}"
+        return text + f"ETA {format_duration(book.eta)}"
+
+
+class ProgressEvents:
+    """Machine-readable progress: a JSON object per line; page events are thinned to one per `interval` seconds."""
+
+    def __init__(self, stream: TextIO = stderr, interval: float = 1.0) -> None:
+        self._stream = stream
+        self._interval = interval
+        self._reported_at: dict[int, float] = {}
+
+    def report(self, book: BookProgress, event: ProgressEvent) -> None:
+        now = monotonic()
+        if event is ProgressEvent.page and now - self._reported_at.get(id(book), 0.0) < self._interval:
+            return
+        self._reported_at[id(book)] = now
+        if event is ProgressEvent.finished:
+            del self._reported_at[id(book)]
+
+        self._stream.write(dumps({"event": event.value, **book.to_json()}, ensure_ascii=False) + "\n")
+        self._stream.flush()
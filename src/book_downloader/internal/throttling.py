@@ -0,0 +1,102 @@
+"""Request scheduling: a cap on in-flight requests plus an adaptive (AIMD) token bucket."""
+
+from asyncio import Lock
+from asyncio import Semaphore
+from asyncio import sleep as sleep_for
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from http import HTTPStatus
+from math import inf
+from time import monotonic
+
+
+@dataclass(frozen=True)
+class ThrottleSettings:
+    """Describes how aggressively requests may be sent to a host."""
+
+    max_in_flight: int = 4
+    initial_rate: float = 2.0
+    min_rate: float = 0.2
+    max_rate: float = 8.0
+    increase_step: float = 0.1
+    decrease_factor: float = 0.5
+
+    def __post_init__(self) -> None:
+        if self.max_in_flight < 1:
+            raise ValueError("max_in_flight must be positive")
+        if not 0 < self.min_rate <= self.max_rate:
+            raise ValueError("rates must satisfy 0 < min_rate <= max_rate")
+        if self.initial_rate <= 0:
+            raise ValueError("initial_rate must be positive")
+        if self.increase_step < 0:
+            raise ValueError("increase_step can't be negative")
+        if not 0 < self.decrease_factor < 1:
+            raise ValueError("decrease_factor must be in (0, 1)")
+
+
+class RequestScheduler:
+    """
+    Gate for outgoing requests.
+
+    At most `max_in_flight` requests run at once and their start times are spread by a token bucket.
+    The bucket refill rate follows AIMD: it grows by `increase_step` after every successful response
+    and is multiplied by `decrease_factor` when the server answers with 429 or 5xx. Requests sent together
+    fail together, so the rate is decreased at most once per refill interval (the time a token takes to arrive).
+    """
+
+    def __init__(self, settings: ThrottleSettings | None = None) -> None:
+        self._settings = settings or ThrottleSettings()
+        self._rate = min(max(self._settings.initial_rate, self._settings.min_rate), self._settings.max_rate)
+
+        self._in_flight = Semaphore(self._settings.max_in_flight)
+        self._bucket_lock = Lock()
+        self._tokens = 1.0
+        self._stamp = monotonic()
+        self._paused_until = 0.0
+        self._slowed_at = -inf
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Wait until a request may be sent and hold its in-flight slot for the duration of the block."""
+        async with self._in_flight:
+            await self._take_token()
+            yield
+
+    def feedback(self, status: int, retry_after: float | None = None) -> None:
+        """Adjust the rate according to the response status; `retry_after` holds all requests back for a while."""
+        if status == HTTPStatus.TOO_MANY_REQUESTS or status >= HTTPStatus.INTERNAL_SERVER_ERROR:
+            self._slow_down()
+            if retry_after:
+                self._paused_until = max(self._paused_until, monotonic() + retry_after)
+        elif status < HTTPStatus.BAD_REQUEST:
+            self._speed_up()
+
+    def _speed_up(self) -> None:
+        self._rate = min(self._rate + self._settings.increase_step, self._settings.max_rate)
+
+    def _slow_down(self) -> None:
+        now = monotonic()
+        if now - self._slowed_at < 1 / self._rate:
+            return
+        self._slowed_at = now
+        self._rate = max(self._rate * self._settings.decrease_factor, self._settings.min_rate)
+
+    async def _take_token(self) -> None:
+        async with self._bucket_lock:
+            while True:
+                if (pause := self._paused_until - monotonic()) > 0:
+                    await sleep_for(pause)
+
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await sleep_for((1 - self._tokens) / self._rate)
+
+    def _refill(self) -> None:
+        now = monotonic()
+        burst = float(self._settings.max_in_flight)
+        self._tokens = min(burst, self._tokens + (now - self._stamp) * self._rate)
+        self._stamp = now
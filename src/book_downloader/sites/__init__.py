@@ -18,14 +18,8 @@ class Service(Protocol):
         """Return service host."""
         ...
 
-    @classmethod
-    async def check_service(cls) -> bool:
-        """Check/ping service."""
-        ...
-
-    @classmethod
-    async def check_url(cls, url: str) -> bool:
-        """Check the accessibility of the url."""
+    async def check_service(self) -> bool:
+        """Check that the service is up (results may be cached for a while)."""
         ...
 
     @classmethod
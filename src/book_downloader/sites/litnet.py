@@ -1,28 +1,45 @@
 from re import fullmatch
 from urllib.parse import urlparse
 
+from book_downloader.internal.downloaders import LITNET_URL
 from book_downloader.internal.downloaders import LitnetBookDownloader
-from book_downloader.internal.network import is_url_reachable
-from book_downloader.internal.network import ping
+from book_downloader.internal.health import HealthMonitor
+from book_downloader.internal.http_client import HttpClient
+from book_downloader.internal.progress import ProgressReporter
+from book_downloader.internal.throttling import RequestScheduler
+from book_downloader.internal.throttling import ThrottleSettings
 
 
 class LitnetService:
     """Implement the `Service` protocol."""
 
-    def __init__(self, token: str) -> None:
+    def __init__(
+        self,
+        token: str,
+        client: HttpClient,
+        throttling: ThrottleSettings | None = None,
+        base_url: str = LITNET_URL,
+        progress: ProgressReporter | None = None,
+    ) -> None:
+        """
+        Create the service; `base_url` points it to another server (e.g. a local stand-in for benchmarks).
+
+        Downloaders of the service report the progress of every book to `progress`.
+        """
         self._token = token
+        self._base_url = base_url.rstrip("/")
+        self._client = client
+        self._progress = progress
+        self._scheduler = RequestScheduler(throttling)
+        self._health = HealthMonitor(client)
 
     @classmethod
     def host(cls) -> str:
         return "litnet.com"
 
-    @classmethod
-    async def check_service(cls) -> bool:
-        return ping(cls.host())
-
-    @classmethod
-    async def check_url(cls, url: str) -> bool:
-        return await is_url_reachable(url)
+    async def check_service(self) -> bool:
+        result = await self._health.check(self._base_url)
+        return result.healthy
 
     @classmethod
     def canonical_book_url(cls, url: str) -> str:
@@ -38,4 +55,6 @@ class LitnetService:
         return f"{url_info.scheme}://{url_info.netloc}{url_info.path}"
 
     def get_downloader(self) -> LitnetBookDownloader:
-        return LitnetBookDownloader(self._token)
+        return LitnetBookDownloader(
+            self._token, self._client, self._scheduler, base_url=self._base_url, progress=self._progress
+        )
@@ -0,0 +1,31 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import IsolatedAsyncioTestCase
+
+from book_downloader.internal.blob_store import BlobStore
+from book_downloader.internal.compressors import Compression
+
+
+class BlobStoreTest(IsolatedAsyncioTestCase):
+    async def test_texts_are_read_back_whatever_the_compression(self) -> None:
+        with TemporaryDirectory() as directory:
+            for compression in Compression.available():
+                with self.subTest(compression=compression):
+                    store = BlobStore(Path(directory) / compression, compression)
+                    content = b"text " * 100_000
+
+                    self.assertEqual(await store.get(await store.put("1", content)), content)
+
+    async def test_damaged_blob_is_not_read(self) -> None:
+        with TemporaryDirectory() as directory:
+            for compression in Compression.available():
+                if compression is Compression.none:
+                    continue
+                with self.subTest(compression=compression):
+                    store = BlobStore(Path(directory) / compression, compression)
+                    digest = await store.put("1", b"text " * 1000)
+                    path = store.path(digest)
+                    assert path is not None
+                    path.write_bytes(path.read_bytes()[:-8])  # a truncated write
+
+                    self.assertIsNone(await store.get(digest))
@@ -0,0 +1,116 @@
+from contextlib import closing
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import IsolatedAsyncioTestCase
+
+from book_downloader.internal.blob_store import BlobStore
+from book_downloader.internal.cache_index import CacheIndex
+from book_downloader.internal.cache_index import CacheLimits
+from book_downloader.internal.metadata import BookMetadata
+from book_downloader.internal.metadata import ChapterMetadata
+from book_downloader.internal.pack_store import PackStore
+
+
+class CacheIndexTest(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self._directory = TemporaryDirectory()
+        self.cache_dir = Path(self._directory.name)
+        self.store = BlobStore(self.cache_dir / "blobs")
+        self.index = CacheIndex(self.cache_dir)
+
+    async def asyncTearDown(self) -> None:
+        self._directory.cleanup()
+
+    async def cache_book(self, key: str, chapters: dict[str, bytes], touch: bool = True) -> BookMetadata:
+        """Put the book with the chapters (by id) into the cache; it's cataloged unless `touch` is False."""
+        book_dir = self.cache_dir / key
+        metadata = BookMetadata(book_dir, self.store, csrf="csrf", author="Author", title=key)
+        for chapter_id, content in chapters.items():
+            chapter = ChapterMetadata(chapter_id, f"Chapter {chapter_id}")
+            chapter.bind(book_dir, self.store)
+            chapter.content_hash = await self.store.put(chapter_id, content)
+            metadata.chapters.append(chapter)
+        await metadata.save()
+        if touch:
+            self.index.touch(book_dir, f"https://example.com/{key}")
+        return metadata
+
+    async def test_texts_of_other_books_survive_removal(self) -> None:
+        first = await self.cache_book("first", {"1": b"shared", "2": b"own"})
+        await self.cache_book("second", {"1": b"shared"})
+
+        self.index.remove("first")
+
+        shared, own = (chapter.content_hash for chapter in first.chapters)
+        self.assertTrue(self.store.contains(shared))
+        self.assertFalse(self.store.contains(own))
+        self.assertEqual([entry.key for entry in self.index.entries()], ["second"])
+
+    async def test_texts_of_books_unknown_to_the_catalog_survive_removal(self) -> None:
+        first = await self.cache_book("first", {"1": b"shared", "2": b"own"})
+        # another process downloads these: one book isn't cataloged yet, the other one changed since it was
+        await self.cache_book("new", {"1": b"shared"}, touch=False)
+        changed = BookMetadata(self.cache_dir / "changed", self.store, csrf="csrf", author="Author", title="changed")
+        changed.chapters = [ChapterMetadata("2", "Chapter 2")]
+        changed.chapters[0].bind(changed.working_dir, self.store)
+        await changed.save()
+        self.index.touch(changed.working_dir, "https://example.com/changed")
+        self.assertTrue(await changed.chapters[0].restore())
+        await changed.record(changed.chapters[0])
+
+        self.index.remove("first")
+
+        for chapter in first.chapters:
+            self.assertTrue(self.store.contains(chapter.content_hash))
+
+    async def test_pinned_texts_survive_eviction(self) -> None:
+        first = await self.cache_book("first", {"1": b"text " * 100})
+        # the book being downloaded has just restored the chapter from the store; nothing is written down yet
+        second = await self.cache_book("second", {})
+        restored = ChapterMetadata("1", "Chapter 1")
+        restored.bind(self.cache_dir / "second", self.store)
+        self.assertTrue(await restored.restore())
+        second.chapters.append(restored)
+
+        evicted = self.index.evict(CacheLimits(max_size=1), keep={"second"}, pinned={restored.content_hash})
+
+        self.assertEqual([entry.key for entry in evicted], ["first"])
+        self.assertEqual(restored.content_hash, first.chapters[0].content_hash)
+        self.assertTrue(self.store.contains(restored.content_hash))
+
+    async def test_stats_count_shared_texts_once(self) -> None:
+        await self.cache_book("first", {"1": b"shared", "2": b"own"})
+        await self.cache_book("second", {"1": b"shared"})
+
+        stats = self.index.stats()
+
+        self.assertEqual(stats.books, 2)
+        self.assertEqual(stats.blobs, 2)
+        self.assertEqual(stats.blobs_size, len(b"shared") + len(b"own"))
+        self.assertEqual(stats.shared_size, len(b"shared"))
+        self.assertEqual(stats.size, self.index.catalog.total_size())
+
+    async def test_stats_leave_texts_of_packed_books_out(self) -> None:
+        await self.cache_book("first", {"1": b"shared"})
+        packed_dir = self.cache_dir / "packed"
+        packed_dir.mkdir()
+        with closing(PackStore(packed_dir)) as store:
+            metadata = BookMetadata(packed_dir, store, csrf="csrf", author="Author", title="packed")
+            chapter = ChapterMetadata("1", "Chapter 1")
+            chapter.bind(packed_dir, store)
+            chapter.content_hash = await store.put("1", b"shared")
+            metadata.chapters.append(chapter)
+            await metadata.save()
+        self.index.touch(packed_dir, "https://example.com/packed")
+
+        stats = self.index.stats()
+
+        self.assertEqual((stats.books, stats.packed_books), (2, 1))
+        self.assertEqual((stats.blobs, stats.blobs_size, stats.shared_size), (1, len(b"shared"), 0))
+
+    async def test_books_found_on_disk_are_cataloged(self) -> None:
+        await self.cache_book("first", {"1": b"text"}, touch=False)
+
+        self.assertEqual(self.index.rebuild(), 1)
+        [entry] = self.index.entries()
+        self.assertEqual((entry.key, entry.title, entry.chapters, entry.chapters_done), ("first", "first", 1, 1))
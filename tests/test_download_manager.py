@@ -0,0 +1,129 @@
+from asyncio import Event
+from asyncio import create_task
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import IsolatedAsyncioTestCase
+
+from book_downloader.application import BookSummary
+from book_downloader.application import export_book
+from book_downloader.core.download_manager import BookDownloader
+from book_downloader.core.download_manager import CacheSettings
+from book_downloader.core.formatters import BookFormat
+from book_downloader.internal.blob_store import ChapterStore
+from book_downloader.internal.cache_index import CacheLimits
+from book_downloader.internal.metadata import BookMetadata
+from book_downloader.internal.metadata import ChapterMetadata
+from book_downloader.internal.misc import fingerprint
+
+BOOK_URL = "https://example.com/en/reader/book"
+OTHER_URL = "https://example.com/en/reader/other"
+THIRD_URL = "https://example.com/en/reader/third"
+
+
+class FakeDownloader:
+    """
+    Serves a book with the listed chapters; remembers which chapters it had to download. Given a `gate`,
+    the download waits for it (`entered` is set when it starts waiting).
+    """
+
+    def __init__(self, chapter_ids: list[str], gate: Event | None = None) -> None:
+        self.chapter_ids = chapter_ids
+        self.fetched: list[str] = []
+        self.gate = gate
+        self.entered = Event()
+
+    def book_key(self, book_url: str) -> str:
+        return book_url.rsplit("/", maxsplit=1)[-1]
+
+    async def fetch_metadata(
+        self, book_url: str, book_dir: Path, store: ChapterStore, refresh: bool = False
+    ) -> BookMetadata:
+        metadata = BookMetadata(book_dir, store)
+        if await metadata.load() and not refresh:
+            return metadata
+
+        cached = {chapter.id: chapter for chapter in metadata.chapters}
+        metadata.csrf, metadata.author, metadata.title = "csrf", "Author", "Title"
+        metadata.chapters = [cached.get(id) or ChapterMetadata(id, f"Chapter {id}") for id in self.chapter_ids]
+        for chapter in metadata.chapters:
+            chapter.bind(book_dir, store)
+        await metadata.save()
+        return metadata
+
+    async def fetch_content(self, metadata: BookMetadata) -> None:
+        self.entered.set()
+        if self.gate is not None:
+            await self.gate.wait()
+        for chapter in metadata.chapters:
+            if not chapter.downloaded:
+                self.fetched.append(chapter.id)
+                chapter.total_pages = 1
+                await metadata.record_page(chapter, await chapter.save_page(1, f"<p>text {chapter.id}</p>" * 100))
+                await chapter.assemble()
+                await metadata.record(chapter)
+            chapter.mark_ready()
+
+
+class FakeService:
+    def __init__(self, downloader: FakeDownloader) -> None:
+        self.downloader = downloader
+
+    def get_downloader(self) -> BookDownloader:
+        return self.downloader
+
+
+class ExportBookTest(IsolatedAsyncioTestCase):
+    async def export(
+        self, working_dir: Path, downloader: FakeDownloader, limits: CacheLimits, update: bool, url: str = BOOK_URL
+    ) -> str:
+        summary = BookSummary(url)
+        await export_book(
+            FakeService(downloader),  # type: ignore[arg-type]
+            summary,
+            [BookFormat.txt],
+            working_dir,
+            use_cache=True,
+            cache_settings=CacheSettings(limits=limits),
+            update=update,
+            executor=None,
+        )
+        [output] = summary.outputs
+        return output.read_text(encoding="utf-8")
+
+    async def test_update_keeps_the_book_until_it_is_exported(self) -> None:
+        with TemporaryDirectory() as directory:
+            working_dir = Path(directory)
+            await self.export(working_dir, FakeDownloader(["1", "2"]), CacheLimits(), update=False)
+
+            # the cache can't hold even a single book, yet the updated book is exported without downloading it again
+            downloader = FakeDownloader(["1", "2", "3"])
+            text = await self.export(working_dir, downloader, CacheLimits(max_size=1), update=True)
+
+            self.assertEqual(downloader.fetched, ["3"])
+            self.assertIn("text 3", text)
+            # once the export is over, the limit applies
+            self.assertFalse((working_dir / ".downloads-cache" / fingerprint("book")).exists())
+
+    async def test_texts_restored_by_a_book_in_use_survive_eviction(self) -> None:
+        with TemporaryDirectory() as directory:
+            working_dir = Path(directory)
+            await self.export(working_dir, FakeDownloader(["1", "2"]), CacheLimits(), update=False)
+
+            # the other book has the same chapters, they're restored from the store; then it waits for a while
+            gate = Event()
+            other = FakeDownloader(["1", "2"], gate)
+            export_other = create_task(
+                self.export(working_dir, other, CacheLimits(max_size=1), update=False, url=OTHER_URL)
+            )
+            await other.entered.wait()
+
+            # meanwhile the first book is evicted by another export; the restored texts must stay
+            await self.export(working_dir, FakeDownloader(["9"]), CacheLimits(max_size=1), update=False, url=THIRD_URL)
+            self.assertFalse((working_dir / ".downloads-cache" / fingerprint("book")).exists())
+
+            gate.set()
+            text = await export_other
+
+            self.assertEqual(other.fetched, [])
+            self.assertIn("text 1", text)
+            self.assertIn("text 2", text)
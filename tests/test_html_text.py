@@ -0,0 +1,46 @@
+from unittest import TestCase
+from warnings import catch_warnings
+from warnings import simplefilter
+
+from bs4 import BeautifulSoup
+
+from book_downloader.internal.html_text import extract_paragraphs
+
+DOCUMENTS = [
+    "",
+    "   ",
+    "no paragraphs at all",
+    "<p>plain</p><p></p><p>second</p>",
+    "<div><p>one <b>bold</b> <i>italic</i></p>\n<p>two<br/>lines</p></div>",
+    "<p>text<script>var x = 1;</script> <style>p {}</style>after</p>",
+    "<p>a<ruby>b<rt>c</rt><rp>d</rp></ruby></p><template><p>hidden</p></template>",
+    "<p> \n </p><pre><p> \n\t</p></pre><textarea><p> </p></textarea>",
+    "<p>&nbsp;&amp;&lt;entities&gt;</p><p>текст</p>",
+    "<p>unclosed<p>paragraphs<div>and a div</div>",
+    "<html><head><title>t</title></head><body><p>full document</p></body></html>",
+    # markup after a stray end of the document
+    "<p>a</p></html><p>b</p>",
+    "<p>a</p></body><p>b</p>",
+    "<html><body><p>a</p></body></html>\n<p>b</p> tail",
+    "<p>a</html>b</p><p>c</p>",
+    "<P>upper</HTML >\n<pre><p> \n </p></pre><p>y<script>z</script> <b>q</b></p>",
+    "</html>",
+    "</html><!-- only a comment -->",
+]
+
+
+def beautifulsoup_paragraphs(html: str) -> list[str]:
+    with catch_warnings():
+        simplefilter("ignore")
+        soup = BeautifulSoup(html, "lxml")
+    return [block.get_text() for block in soup.find_all("p")]
+
+
+class ExtractParagraphsTest(TestCase):
+    def test_output_is_identical_to_beautifulsoup(self) -> None:
+        for html in DOCUMENTS:
+            with self.subTest(html=html):
+                self.assertEqual(extract_paragraphs(html), beautifulsoup_paragraphs(html))
+
+    def test_content_after_stray_html_end_is_kept(self) -> None:
+        self.assertEqual(extract_paragraphs("<p>first</p></html><p>second</p>"), ["first", "second"])
@@ -0,0 +1,97 @@
+from asyncio import start_server
+from json import JSONDecodeError
+from json import dumps
+from unittest import IsolatedAsyncioTestCase
+
+from aiohttp.test_utils import TestServer
+from aiohttp.web import Application
+from aiohttp.web import Request
+from aiohttp.web import Response
+
+from book_downloader.core.exceptions import DownloadException
+from book_downloader.internal.downloaders.litnet_book_downloader import LitnetBookDownloader
+from book_downloader.internal.http_client import HttpClient
+from book_downloader.internal.http_client import HttpSettings
+from book_downloader.internal.http_client import RetryPolicy
+
+NO_PAUSES = HttpSettings(retry=RetryPolicy(attempts=3, backoff=0.0))
+
+
+class FakeServer:
+    """Answers `/json` with the queued bodies one by one; the last one is repeated."""
+
+    def __init__(self, *bodies: str, status: int = 200, content_type: str = "application/json") -> None:
+        self.bodies = list(bodies)
+        self.status = status
+        self.content_type = content_type
+        self.hits = 0
+
+    async def handle(self, request: Request) -> Response:
+        self.hits += 1
+        body = self.bodies.pop(0) if len(self.bodies) > 1 else self.bodies[0]
+        return Response(text=body, status=self.status, content_type=self.content_type, charset="utf-8")
+
+    def start(self) -> TestServer:
+        app = Application()
+        app.router.add_get("/json", self.handle)
+        return TestServer(app)
+
+
+class GetJsonTest(IsolatedAsyncioTestCase):
+    async def test_malformed_body_is_retried(self) -> None:
+        fake = FakeServer('{"broken', '{"ok": true}')
+        async with fake.start() as server, HttpClient(NO_PAUSES) as client:
+            self.assertEqual(await client.get_json(str(server.make_url("/json"))), {"ok": True})
+        self.assertEqual(fake.hits, 2)
+
+    async def test_malformed_body_of_the_last_attempt_is_raised(self) -> None:
+        fake = FakeServer("not json")
+        async with fake.start() as server, HttpClient(NO_PAUSES) as client:
+            with self.assertRaises(JSONDecodeError):
+                await client.get_json(str(server.make_url("/json")))
+        self.assertEqual(fake.hits, 3)
+
+    async def test_truncated_body_is_retried(self) -> None:
+        hits = 0
+
+        async def handle(reader, writer):  # type: ignore[no-untyped-def]
+            nonlocal hits
+            hits += 1
+            await reader.readuntil(b"\r\n\r\n")
+            body = b'{"ok": true}'
+            if hits == 1:
+                # promise more than is sent and drop the connection
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: 100\r\n\r\n{")
+            else:
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: close\r\n"
+                    b"Content-Length: %d\r\n\r\n%s" % (len(body), body)
+                )
+            await writer.drain()
+            writer.close()
+
+        server = await start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server, HttpClient(NO_PAUSES) as client:
+            self.assertEqual(await client.get_json(f"http://127.0.0.1:{port}/json"), {"ok": True})
+        self.assertEqual(hits, 2)
+
+
+class ChapterDataTest(IsolatedAsyncioTestCase):
+    async def get_page(self, fake: FakeServer) -> None:
+        # litnet serves the page JSON as html
+        fake.content_type = "text/html"
+        app = Application()
+        app.router.add_get("/reader/get-page", fake.handle)
+        async with TestServer(app) as server, HttpClient(NO_PAUSES) as client:
+            downloader = LitnetBookDownloader("token", client, base_url=str(server.make_url("")))
+            await downloader._get_chapter_data("csrf", "1", 1)
+
+    async def test_missing_number_of_pages_is_a_download_error(self) -> None:
+        for body in [{"data": "<p>text</p>"}, {"data": "<p>text</p>", "totalPages": "many"}]:
+            with self.subTest(body=body), self.assertRaisesRegex(DownloadException, "number of pages"):
+                await self.get_page(FakeServer(dumps(body)))
+
+    async def test_error_status_is_a_download_error(self) -> None:
+        with self.assertRaisesRegex(DownloadException, "HTTP 404"):
+            await self.get_page(FakeServer("{}", status=404))
@@ -0,0 +1,68 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import IsolatedAsyncioTestCase
+
+from book_downloader.internal.blob_store import BlobStore
+from book_downloader.internal.metadata import BookMetadata
+from book_downloader.internal.metadata import ChapterMetadata
+from book_downloader.internal.metadata import read_manifest
+
+
+class BookJournalTest(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self._directory = TemporaryDirectory()
+        self.book_dir = Path(self._directory.name) / "book"
+        self.store = BlobStore(Path(self._directory.name) / "blobs")
+
+    async def asyncTearDown(self) -> None:
+        self._directory.cleanup()
+
+    async def open_book(self) -> BookMetadata:
+        metadata = BookMetadata(self.book_dir, self.store)
+        if not await metadata.load():
+            metadata.csrf, metadata.author, metadata.title = "csrf", "Author", "Title"
+            metadata.chapters = [ChapterMetadata("1", "One")]
+            for chapter in metadata.chapters:
+                chapter.bind(self.book_dir, self.store)
+            await metadata.save()
+        return metadata
+
+    async def fetch_page(self, metadata: BookMetadata, index: int) -> None:
+        chapter = metadata.chapters[0]
+        chapter.total_pages = 3
+        await metadata.record_page(chapter, await chapter.save_page(index, f"<p>page {index}</p>"))
+
+    async def test_pages_are_replayed_from_the_journal(self) -> None:
+        metadata = await self.open_book()
+        await self.fetch_page(metadata, 1)
+        await self.fetch_page(metadata, 2)
+
+        reopened = await self.open_book()
+
+        self.assertTrue(metadata.journal_path.is_file())
+        self.assertEqual([page.index for page in reopened.chapters[0].pages], [1, 2])
+        self.assertEqual(reopened.chapters[0].missing_pages, [3])
+
+    async def test_record_after_a_torn_tail_is_kept(self) -> None:
+        metadata = await self.open_book()
+        await self.fetch_page(metadata, 1)
+        with metadata.journal_path.open("a", encoding="utf-8") as file:
+            file.write('{"chapter_id":"1","total_pages":3,"page":{"ind')  # a crash in the middle of a record
+
+        resumed = await self.open_book()
+        await self.fetch_page(resumed, 2)
+        reopened = await self.open_book()
+
+        self.assertEqual([page.index for page in reopened.chapters[0].pages], [1, 2])
+        self.assertEqual([page["index"] for page in read_manifest(self.book_dir)["chapters"][0]["pages"]], [1, 2])
+
+    async def test_undecodable_line_is_compacted_on_load(self) -> None:
+        metadata = await self.open_book()
+        await self.fetch_page(metadata, 1)
+        with metadata.journal_path.open("a", encoding="utf-8") as file:
+            file.write("garbage\n")
+
+        reopened = await self.open_book()
+
+        self.assertFalse(reopened.journal_path.exists())
+        self.assertEqual([page.index for page in reopened.chapters[0].pages], [1])
@@ -0,0 +1,39 @@
+from contextlib import closing
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import IsolatedAsyncioTestCase
+
+from book_downloader.internal.compressors import Compression
+from book_downloader.internal.pack_store import PackStore
+
+
+class PackStoreTest(IsolatedAsyncioTestCase):
+    async def test_empty_text_is_read_back(self) -> None:
+        with TemporaryDirectory() as directory, closing(PackStore(Path(directory))) as store:
+            digest = await store.put("1", b"")
+
+            self.assertTrue(store.contains(digest))
+            self.assertEqual(await store.get(digest), b"")
+
+    async def test_empty_text_next_to_other_texts(self) -> None:
+        with TemporaryDirectory() as directory, closing(PackStore(Path(directory))) as store:
+            first = await store.put("1", b"first chapter")
+            empty = await store.put("2", b"")
+            last = await store.put("3", b"last chapter")
+
+            self.assertEqual(await store.get(first), b"first chapter")
+            self.assertEqual(await store.get(empty), b"")
+            self.assertEqual(await store.get(last), b"last chapter")
+
+    async def test_texts_survive_reopening(self) -> None:
+        with TemporaryDirectory() as directory:
+            for compression in Compression.available():
+                with self.subTest(compression=compression):
+                    book_dir = Path(directory) / compression
+                    with closing(PackStore(book_dir, compression)) as store:
+                        book_dir.mkdir()
+                        digests = [await store.put(str(index), b"text " * index) for index in range(3)]
+
+                    with closing(PackStore(book_dir)) as store:
+                        self.assertEqual([await store.lookup(str(index)) for index in range(3)], digests)
+                        self.assertEqual([await store.get(digest) for digest in digests], [b"", b"text ", b"text " * 2])
@@ -0,0 +1,83 @@
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+from book_downloader.internal.throttling import RequestScheduler
+from book_downloader.internal.throttling import ThrottleSettings
+
+
+class FakeClock:
+    """Stands for `monotonic` and `sleep` of the scheduler: sleeping only moves the time forward."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class RequestSchedulerTest(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        for name, fake in [("monotonic", self.clock.monotonic), ("sleep_for", self.clock.sleep)]:
+            patcher = patch(f"book_downloader.internal.throttling.{name}", fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def scheduler(self, **settings: float) -> RequestScheduler:
+        # a single slot makes the bucket hold one token at most: requests are sent exactly 1 / rate apart
+        return RequestScheduler(ThrottleSettings(max_in_flight=1, **settings))
+
+    async def interval(self, scheduler: RequestScheduler) -> float:
+        """Send two requests one after another; return the time between them."""
+        async with scheduler.slot():
+            sent = self.clock.now
+        async with scheduler.slot():
+            return self.clock.now - sent
+
+    async def test_simultaneous_failures_decrease_the_rate_once(self) -> None:
+        scheduler = self.scheduler(initial_rate=4.0, decrease_factor=0.5)
+
+        for _ in range(4):
+            scheduler.feedback(503)
+
+        self.assertAlmostEqual(await self.interval(scheduler), 1 / 2.0)
+
+    async def test_failures_after_the_refill_interval_decrease_the_rate_again(self) -> None:
+        scheduler = self.scheduler(initial_rate=8.0, max_rate=8.0, decrease_factor=0.5)
+
+        scheduler.feedback(429)
+        self.clock.now += 1 / 4
+        scheduler.feedback(429)
+
+        self.assertAlmostEqual(await self.interval(scheduler), 1 / 2.0)
+
+    async def test_rate_never_falls_below_the_minimum(self) -> None:
+        scheduler = self.scheduler(initial_rate=1.0, min_rate=0.8, decrease_factor=0.5)
+
+        scheduler.feedback(500)
+
+        self.assertAlmostEqual(await self.interval(scheduler), 1 / 0.8)
+
+    async def test_successes_increase_the_rate(self) -> None:
+        scheduler = self.scheduler(initial_rate=1.0, increase_step=0.5)
+
+        scheduler.feedback(200)
+        scheduler.feedback(404)
+
+        self.assertAlmostEqual(await self.interval(scheduler), 1 / 1.5)
+
+    async def test_retry_after_holds_requests_back(self) -> None:
+        scheduler = self.scheduler(initial_rate=4.0, min_rate=4.0)
+
+        scheduler.feedback(429, retry_after=3.0)
+
+        async with scheduler.slot():
+            self.assertAlmostEqual(self.clock.now, 3.0)
+
+    def test_settings_reject_rates_that_stop_the_requests(self) -> None:
+        for settings in [{"initial_rate": 0.0}, {"initial_rate": -1.0}, {"increase_step": -0.1}]:
+            with self.subTest(settings=settings), self.assertRaises(ValueError):
+                ThrottleSettings(**settings)  # type: ignore[arg-type]
@@ -0,0 +1,279 @@
+"""
+Measure download and export throughput against the local stand-in of litnet.com (`tools/fake_litnet.py`).
+
+    uv run python tools/benchmark_download.py --books 20 --chapters 30 --pages 5 --latency 0.05 -f txt -f epub
+
+The server runs in a separate process, so it takes neither CPU time nor memory of the measured one.
+The stages are: downloading all books into an empty cache, exporting them, and exporting them once again
+(the second export reads the parsed chapters kept by the first one). Peak RSS is taken from `getrusage`,
+so it's the peak of the whole run up to the end of the stage; formatting processes are accounted only once
+they're finished, so both export stages report the same peak of them (Unix only).
+"""
+
+from asyncio import Semaphore
+from asyncio import gather
+from asyncio import run
+from collections.abc import Awaitable
+from collections.abc import Callable
+from dataclasses import asdict
+from dataclasses import dataclass
+from json import dumps
+from json import loads
+from pathlib import Path
+from resource import RUSAGE_CHILDREN
+from resource import RUSAGE_SELF
+from resource import getrusage
+from socket import socket
+from subprocess import DEVNULL
+from subprocess import Popen
+from sys import executable
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from time import sleep
+from types import SimpleNamespace
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from aiohttp import ClientSession
+from aiohttp import TraceConfig
+from aiohttp import TraceRequestEndParams
+from aiohttp import TraceRequestStartParams
+from click import Choice
+from click import FloatRange
+from click import IntRange
+from click import Path as PathType
+from click import command
+from click import echo
+from click import option
+
+from book_downloader.core.book_exporter import BookExporter
+from book_downloader.core.download_manager import CacheSettings
+from book_downloader.core.download_manager import DownloadManager
+from book_downloader.core.formatters import BookFormat
+from book_downloader.core.formatters import get_formatter
+from book_downloader.internal.asyncio import process_pool
+from book_downloader.internal.cli_types import PositiveFloatType
+from book_downloader.internal.compressors import Compression
+from book_downloader.internal.http_client import HttpClient
+from book_downloader.internal.http_client import HttpSettings
+from book_downloader.internal.throttling import ThrottleSettings
+from book_downloader.sites.litnet import LitnetService
+
+
+@dataclass
+class StageResult:
+    name: str
+    elapsed: float
+    books: int
+    pages: int
+    p50_latency: float = 0.0
+    p99_latency: float = 0.0
+    peak_rss: int = 0  # bytes
+    peak_children_rss: int = 0  # bytes, the largest formatting process of both export stages
+
+    def __str__(self) -> str:
+        text = (
+            f"{self.name:>10}: {self.elapsed:8.2f} s  {self.books / self.elapsed * 60:8.1f} books/min  "
+            f"{self.pages / self.elapsed:9.1f} pages/s"
+        )
+        if self.p99_latency:
+            text += f"  p50 {self.p50_latency * 1000:7.1f} ms  p99 {self.p99_latency * 1000:7.1f} ms"
+        return (
+            text + f"  peak RSS {self.peak_rss / 2**20:.0f} MiB (formatters {self.peak_children_rss / 2**20:.0f} MiB)"
+        )
+
+
+class LatencyRecorder:
+    """Collects durations of page requests (every attempt is a sample) via aiohttp tracing."""
+
+    def __init__(self) -> None:
+        self.samples: list[float] = []
+        self.trace_config = TraceConfig()
+        self.trace_config.on_request_start.append(self._on_start)
+        self.trace_config.on_request_end.append(self._on_end)
+
+    def percentile(self, share: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(int(share * len(ordered)), len(ordered) - 1)]
+
+    @staticmethod
+    async def _on_start(session: ClientSession, context: SimpleNamespace, params: TraceRequestStartParams) -> None:
+        context.started = perf_counter()
+
+    async def _on_end(self, session: ClientSession, context: SimpleNamespace, params: TraceRequestEndParams) -> None:
+        if params.url.path.endswith("/reader/get-page"):
+            self.samples.append(perf_counter() - context.started)
+
+
+def free_port() -> int:
+    with socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return int(probe.getsockname()[1])
+
+
+def wait_for_server(base_url: str, timeout: float = 10.0) -> None:
+    deadline = perf_counter() + timeout
+    while True:
+        try:
+            with urlopen(f"{base_url}/_stats"):
+                return
+        except URLError:
+            if perf_counter() > deadline:
+                raise
+            sleep(0.1)
+
+
+def server_stats(base_url: str) -> dict[str, int]:
+    with urlopen(f"{base_url}/_stats") as response:
+        stats: dict[str, int] = loads(response.read())
+        return stats
+
+
+def measure_peak_rss() -> tuple[int, int]:
+    """Peak resident set size of this process and of the largest child process, in bytes."""
+    return getrusage(RUSAGE_SELF).ru_maxrss * 1024, getrusage(RUSAGE_CHILDREN).ru_maxrss * 1024
+
+
+async def run_stage(
+    name: str, urls: list[str], pages_per_book: int, max_books: int, process: Callable[[str], Awaitable[None]]
+) -> StageResult:
+    budget = Semaphore(max_books)
+
+    async def process_book(url: str) -> None:
+        async with budget:
+            await process(url)
+
+    started = perf_counter()
+    await gather(*(process_book(url) for url in urls))
+    elapsed = perf_counter() - started
+
+    rss, _ = measure_peak_rss()
+    return StageResult(name, elapsed, len(urls), len(urls) * pages_per_book, peak_rss=rss)
+
+
+async def benchmark(
+    base_url: str,
+    books: int,
+    pages_per_book: int,
+    max_books: int,
+    formats: list[BookFormat],
+    format_workers: int | None,
+    throttling: ThrottleSettings,
+    http_settings: HttpSettings,
+    cache_settings: CacheSettings,
+) -> list[StageResult]:
+    urls = [f"{base_url}/en/reader/book-{index}" for index in range(books)]
+    recorder = LatencyRecorder()
+
+    with TemporaryDirectory() as temp_dir:
+        working_dir = Path(temp_dir)
+        manager = DownloadManager(working_dir, cache_settings)
+        async with HttpClient(http_settings, trace_configs=[recorder.trace_config]) as client:
+            service = LitnetService("benchmark", client, throttling, base_url=base_url)
+
+            async def download(url: str) -> None:
+                await manager.update_book(url, service.get_downloader())
+
+            results = [await run_stage("download", urls, pages_per_book, max_books, download)]
+            results[0].p50_latency = recorder.percentile(0.5)
+            results[0].p99_latency = recorder.percentile(0.99)
+
+            with process_pool(format_workers) as executor:
+                exporter = BookExporter(working_dir / "books", [get_formatter(f) for f in formats], executor)
+
+                async def export(url: str) -> None:
+                    async with manager.get_book(url, service.get_downloader()) as book:
+                        await exporter.dump(book)
+
+                results.append(await run_stage("export", urls, pages_per_book, max_books, export))
+                results.append(await run_stage("re-export", urls, pages_per_book, max_books, export))
+
+    _, children_rss = measure_peak_rss()
+    for result in results[1:]:
+        result.peak_children_rss = children_rss
+    return results
+
+
+@command()
+@option("--books", type=IntRange(min=1), default=10, show_default=True)
+@option("--chapters", type=IntRange(min=1), default=20, show_default=True, help="chapters per book")
+@option("--pages", type=IntRange(min=1), default=5, show_default=True, help="pages per chapter")
+@option("--paragraphs", type=IntRange(min=1), default=30, show_default=True, help="paragraphs per page")
+@option("--latency", type=FloatRange(min=0), default=0.02, show_default=True, help="server latency per page (s)")
+@option("--jitter", type=FloatRange(min=0), default=0.01, show_default=True, help="random extra latency (s)")
+@option("--error-rate", type=FloatRange(0, 1), default=0.0, show_default=True, help="share of 500 responses")
+@option("--throttle-rate", type=FloatRange(0, 1), default=0.0, show_default=True, help="share of 429 responses")
+@option("--max-books", type=IntRange(min=1), default=4, show_default=True, help="books processed simultaneously")
+@option("--max-in-flight", type=IntRange(min=1), default=16, show_default=True)
+@option("--max-rate", type=PositiveFloatType(), default=1000.0, show_default=True)
+@option("-f", "--save-format", "formats", type=Choice(BookFormat), multiple=True, default=[BookFormat.txt])
+@option("--format-workers", type=IntRange(min=0), default=None, help="[default: number of CPUs]")
+@option("--compression", type=Choice(Compression.available()), default=Compression.none, show_default=True)
+@option("--packed-cache", is_flag=True)
+@option("--json", "json_path", type=PathType(dir_okay=False), help="also save the results as JSON")
+def main(
+    books: int,
+    chapters: int,
+    pages: int,
+    paragraphs: int,
+    latency: float,
+    jitter: float,
+    error_rate: float,
+    throttle_rate: float,
+    max_books: int,
+    max_in_flight: int,
+    max_rate: float,
+    formats: tuple[BookFormat, ...],
+    format_workers: int | None,
+    compression: Compression,
+    packed_cache: bool,
+    json_path: str | None,
+) -> None:
+    """Benchmark downloading and exporting books served by the local stand-in of litnet.com."""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server_options = {
+        "--port": port,
+        "--chapters": chapters,
+        "--pages": pages,
+        "--paragraphs": paragraphs,
+        "--latency": latency,
+        "--jitter": jitter,
+        "--error-rate": error_rate,
+        "--throttle-rate": throttle_rate,
+        "--retry-after": 0,
+    }
+    arguments = [str(item) for pair in server_options.items() for item in pair]
+    server = Popen([executable, str(Path(__file__).with_name("fake_litnet.py")), *arguments], stdout=DEVNULL)
+    try:
+        wait_for_server(base_url)
+        results = run(
+            benchmark(
+                base_url,
+                books,
+                chapters * pages,
+                max_books,
+                list(dict.fromkeys(formats)),
+                format_workers,
+                ThrottleSettings(max_in_flight=max_in_flight, initial_rate=max_rate, max_rate=max_rate),
+                HttpSettings(connections_per_host=max_in_flight),
+                CacheSettings(compression=compression, packed=packed_cache),
+            )
+        )
+        stats = server_stats(base_url)
+    finally:
+        server.terminate()
+        server.wait()
+
+    for result in results:
+        echo(result)
+    echo("server: " + ", ".join(f"{name} {count}" for name, count in sorted(stats.items())))
+
+    if json_path is not None:
+        Path(json_path).write_text(dumps({"stages": [asdict(result) for result in results], "server": stats}, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Compare chapter text extraction engines on a corpus of saved chapter HTML.
+
+The corpus is any set of files/directories with chapter HTML, e.g. a book cache:
+
+    uv run python tools/benchmark_formatter.py .downloads-cache --rounds 5
+"""
+
+from collections.abc import Callable
+from collections.abc import Iterator
+from pathlib import Path
+from time import perf_counter
+from warnings import filterwarnings
+
+from bs4 import BeautifulSoup
+from bs4 import XMLParsedAsHTMLWarning
+from click import Path as PathType
+from click import argument
+from click import command
+from click import echo
+from click import option
+
+from book_downloader.internal.html_text import extract_paragraphs
+
+type Extractor = Callable[[str], list[str]]
+
+
+def beautifulsoup_paragraphs(html: str) -> list[str]:
+    """The extraction `TextFormatter` used to perform."""
+    soup = BeautifulSoup(html, "lxml")
+    return [block.get_text() for block in soup.find_all("p")]
+
+
+ENGINES: dict[str, Extractor] = {"beautifulsoup": beautifulsoup_paragraphs, "lxml": extract_paragraphs}
+
+
+def collect_corpus(paths: tuple[Path, ...]) -> Iterator[tuple[Path, str]]:
+    for path in paths:
+        files = sorted(path.rglob("*")) if path.is_dir() else [path]
+        for file in files:
+            if not file.is_file() or file.suffix in {".json", ".download"}:
+                continue
+            try:
+                yield file, file.read_text(encoding="utf-8")
+            except UnicodeDecodeError:
+                continue
+
+
+def measure(engine: Extractor, corpus: list[str], rounds: int) -> float:
+    """Return the best time of processing the whole corpus."""
+    best = float("inf")
+    for _ in range(rounds):
+        start = perf_counter()
+        for html in corpus:
+            engine(html)
+        best = min(best, perf_counter() - start)
+    return best
+
+
+@command()
+@argument("paths", nargs=-1, required=True, type=PathType(exists=True))
+@option("--rounds", default=3, show_default=True, help="number of passes over the corpus; the best one counts")
+def main(paths: tuple[str, ...], rounds: int) -> None:
+    """Benchmark chapter text extraction engines and check that their output is identical."""
+    filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
+
+    documents = list(collect_corpus(tuple(Path(path) for path in paths)))
+    if not documents:
+        echo("corpus is empty", err=True)
+        return
+
+    corpus = [html for _, html in documents]
+    corpus_size = sum(len(html.encode("utf-8")) for html in corpus)
+    echo(f"corpus: {len(corpus)} documents, {corpus_size / 2**20:.2f} MiB")
+
+    mismatches = [file for file, html in documents if beautifulsoup_paragraphs(html) != extract_paragraphs(html)]
+    for file in mismatches:
+        echo(f"output mismatch: {file}", err=True)
+
+    timings = {name: measure(engine, corpus, rounds) for name, engine in ENGINES.items()}
+    baseline = timings["beautifulsoup"]
+    for name, elapsed in timings.items():
+        per_document = elapsed / len(corpus) * 1000
+        throughput = corpus_size / 2**20 / elapsed
+        echo(
+            f"{name:>14}: {elapsed:8.3f} s  {per_document:8.3f} ms/doc  {throughput:8.2f} MiB/s  "
+            f"x{baseline / elapsed:.2f}"
+        )
+
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Local stand-in for litnet.com serving generated books; `tools/benchmark_download.py` measures against it.
+
+    uv run python tools/fake_litnet.py --port 8080 --chapters 30 --pages 5 --latency 0.05 --throttle-rate 0.02
+
+Every `/<lang>/reader/<slug>` is a book, its pages are served by `/reader/get-page` the same way litnet does it
+(a CSRF token from the book page is required). `GET /_stats` reports the number of served requests.
+"""
+
+from asyncio import sleep
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from random import Random
+from random import random
+from urllib.parse import parse_qsl
+
+from aiohttp.web import AppKey
+from aiohttp.web import Application
+from aiohttp.web import Request
+from aiohttp.web import Response
+from aiohttp.web import json_response
+from aiohttp.web import run_app
+from click import FloatRange
+from click import IntRange
+from click import command
+from click import option
+
+CSRF_TOKEN = "fake-csrf-token"
+
+_WORDS = (
+    "the of and to in was he that it his her with as for had you not be on at by which have or from this "
+    "тиша вітер місто ніч світло дорога серце вогонь тінь дзеркало"
+).split()
+
+
+@dataclass(frozen=True)
+class FakeLitnetSettings:
+    chapters: int = 20
+    pages: int = 5
+    paragraphs: int = 30  # per page
+    latency: float = 0.0  # seconds every page request takes
+    jitter: float = 0.0  # up to that many seconds are randomly added to the latency
+    error_rate: float = 0.0  # share of page requests failed with 500
+    throttle_rate: float = 0.0  # share of page requests rejected with 429
+    retry_after: int = 1
+
+
+SETTINGS = AppKey("settings", FakeLitnetSettings)
+STATS = AppKey("stats", Counter[str])
+
+
+@lru_cache(maxsize=4096)
+def page_html(chapter_id: str, page: int, paragraphs: int) -> str:
+    """Generate the page content; the same page is always the same."""
+    generator = Random(f"{chapter_id}/{page}")
+    blocks = []
+    for _ in range(paragraphs):
+        words = generator.choices(_WORDS, k=generator.randint(20, 80))
+        emphasized = generator.randrange(len(words))
+        words[emphasized] = f"<i>{words[emphasized]}</i>"
+        blocks.append(f"<p>{' '.join(words).capitalize()}.</p>")
+    return "".join(blocks)
+
+
+async def book_page(request: Request) -> Response:
+    settings, stats = request.app[SETTINGS], request.app[STATS]
+    stats["books"] += 1
+
+    slug = request.match_info["slug"]
+    options = "".join(
+        f'<option value="{slug}-{index}">Chapter {index}</option>' for index in range(1, settings.chapters + 1)
+    )
+    html = (
+        f'<html><head><meta name="csrf-token" content="{CSRF_TOKEN}"></head><body>'
+        f'<a class="sa-name" href="#">Author of {slug}</a><h1 class="book-heading">Book {slug}</h1>'
+        f'<select name="chapter">{options}</select></body></html>'
+    )
+    return Response(text=html, content_type="text/html")
+
+
+async def get_page(request: Request) -> Response:
+    settings, stats = request.app[SETTINGS], request.app[STATS]
+    query = dict(request.query) | dict(parse_qsl(await request.text()))
+
+    if request.headers.get("X-CSRF-Token") != CSRF_TOKEN:
+        stats["forbidden"] += 1
+        return Response(status=403, text="csrf token mismatch")
+
+    chapter_id, page = query.get("chapterId", ""), int(query.get("page", "1"))
+    if not chapter_id or not 1 <= page <= settings.pages:
+        stats["not_found"] += 1
+        return Response(status=404, text="no such page")
+
+    await sleep(settings.latency + settings.jitter * random())
+
+    chance = random()
+    if chance < settings.throttle_rate:
+        stats["throttled"] += 1
+        return Response(status=429, text="too many requests", headers={"Retry-After": str(settings.retry_after)})
+    if chance < settings.throttle_rate + settings.error_rate:
+        stats["errors"] += 1
+        return Response(status=500, text="internal error")
+
+    stats["pages"] += 1
+    data = {"data": page_html(chapter_id, page, settings.paragraphs), "totalPages": settings.pages}
+    # litnet declares its JSON as html
+    return json_response(data, content_type="text/html")
+
+
+async def root(request: Request) -> Response:
+    return Response(text="fake litnet")
+
+
+async def stats(request: Request) -> Response:
+    return json_response(request.app[STATS])
+
+
+def create_app(settings: FakeLitnetSettings) -> Application:
+    app = Application()
+    app[SETTINGS] = settings
+    app[STATS] = Counter[str]()
+    app.router.add_get("/", root)
+    app.router.add_get("/_stats", stats)
+    app.router.add_get("/reader/get-page", get_page)
+    app.router.add_get("/{lang}/reader/{slug}", book_page)
+    return app
+
+
+@command()
+@option("--host", default="127.0.0.1", show_default=True)
+@option("--port", type=IntRange(min=0), default=8080, show_default=True)
+@option("--chapters", type=IntRange(min=1), default=FakeLitnetSettings.chapters, show_default=True)
+@option("--pages", type=IntRange(min=1), default=FakeLitnetSettings.pages, show_default=True, help="pages per chapter")
+@option("--paragraphs", type=IntRange(min=1), default=FakeLitnetSettings.paragraphs, show_default=True)
+@option("--latency", type=FloatRange(min=0), default=0.0, show_default=True, help="seconds per page request")
+@option("--jitter", type=FloatRange(min=0), default=0.0, show_default=True, help="random extra latency (seconds)")
+@option("--error-rate", type=FloatRange(0, 1), default=0.0, show_default=True, help="share of 500 responses")
+@option("--throttle-rate", type=FloatRange(0, 1), default=0.0, show_default=True, help="share of 429 responses")
+@option("--retry-after", type=IntRange(min=0), default=1, show_default=True, help="Retry-After of 429 responses")
+def main(
+    host: str,
+    port: int,
+    chapters: int,
+    pages: int,
+    paragraphs: int,
+    latency: float,
+    jitter: float,
+    error_rate: float,
+    throttle_rate: float,
+    retry_after: int,
+) -> None:
+    """Serve generated books the way litnet.com does."""
+    settings = FakeLitnetSettings(
+        chapters=chapters,
+        pages=pages,
+        paragraphs=paragraphs,
+        latency=latency,
+        jitter=jitter,
+        error_rate=error_rate,
+        throttle_rate=throttle_rate,
+        retry_after=retry_after,
+    )
+    run_app(create_app(settings), host=host, port=port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()